@@ -0,0 +1,96 @@
+"""Benchmark of parsing and ordering churn timelines.
+
+Generates synthetic churn event files with an increasing number of steps
+(moments out of time order, several steps per moment, many at the same
+time), then times loading the YAML and building the Churn timeline. The
+timeline order is compared with the previous bubble sort, which is only run
+up to --reference-limit steps.
+
+Run from src/master:
+    python -m benchmarks.churn_sort --steps 1000 --steps 100000
+"""
+import random
+import time
+
+import click
+import yaml
+
+from lsdsuite.churn import Churn
+
+
+def synthetic_events(n_steps, n_services=10, duration=7200):
+    """Returns the YAML of a churn with about `n_steps` start/stop steps."""
+    services = ["service-%d" % i for i in range(n_services)]
+    events = [{'beginning': {service: 10 for service in services}}]
+
+    moments = []
+    n_moments = max(1, n_steps // 2)
+    for i in range(n_moments):
+        # coarse times, so that many moments share the same time
+        moment_time = random.randint(1, duration // 10) * 10
+        service = random.choice(services)
+        moments.append({'moment': {'time': moment_time, 'services': {
+            service: [{'start': {'amount': 1}}, {'stop': {'amount': 1}}]}}})
+    events += moments
+    events.append({'end': duration + 10})
+    return yaml.dump({'events': events}, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+
+
+def bubble_sort_reference(steps):
+    """Previous implementation, bubble sort on the step time."""
+    arr = list(steps)
+    n = len(arr)
+    for i in range(n):
+        for j in range(0, n - i - 1):
+            if arr[j].time > arr[j + 1].time:
+                arr[j], arr[j + 1] = arr[j + 1], arr[j]
+    return arr
+
+
+@click.command()
+@click.option('--steps', type=int, multiple=True, default=[1000, 10000, 100000],
+              help="Number of churn steps (repeat option).")
+@click.option('--reference-limit', type=int, default=5000,
+              help="Skip the bubble sort above this many steps.")
+@click.option('--seed', type=int, default=42)
+def main(steps, reference_limit, seed):
+    random.seed(seed)
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    click.echo("{:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "steps", "yaml (s)", "churn (s)", "sort (s)", "bubble (s)", "identical"))
+
+    for n in steps:
+        events = synthetic_events(n)
+
+        start = time.perf_counter()
+        spec = yaml.load(events, Loader=loader)
+        yaml_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        churn = Churn(spec)
+        churn_time = time.perf_counter() - start
+
+        # the timeline in the order it was specified, before sorting
+        unsorted = Churn.__new__(Churn)
+        unsorted.start_replicas = {}
+        unsorted = unsorted._parse_synthetic(spec['events'])
+
+        start = time.perf_counter()
+        ordered = sorted(unsorted, key=lambda step: step.time)
+        sort_time = time.perf_counter() - start
+
+        bubble_time, identical = None, None
+        if n <= reference_limit:
+            start = time.perf_counter()
+            reference = bubble_sort_reference(unsorted)
+            bubble_time = time.perf_counter() - start
+            identical = [id(step) for step in reference] == [id(step) for step in ordered]
+
+        click.echo("{:>10} {:>10.3f} {:>10.3f} {:>10.4f} {:>10} {:>10}".format(
+            len(churn.timeline), yaml_time, churn_time, sort_time,
+            "-" if bubble_time is None else "{:.3f}".format(bubble_time),
+            "-" if identical is None else str(identical)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Benchmark of the container stats derivation in Parser.
+
+Builds synthetic container stats for an increasing number of containers and
+times Parser._process_container_stats, comparing it with the previous
+implementation (one DataFrame filter per container).
+
+Run from src/master:
+    python -m benchmarks.parser_stats --containers 1000 --containers 10000
+"""
+import random
+import time
+
+import click
+import pandas
+
+from lsdsuite.parser.parse import Parser
+
+
+def synthetic_parser(n_containers, n_samples):
+    parser = Parser("synthetic.log")
+    counters = ["rx_bytes", "rx_packets", "rx_dropped", "tx_bytes", "tx_packets", "tx_dropped"]
+
+    parser.containers_ids = [{"container_id": "container-%d" % i, "service": "service", "slot": str(i)}
+                             for i in range(n_containers)]
+    stats = []
+    for sample in range(n_samples):
+        for i in range(n_containers):
+            entry = dict(time=sample + random.random() / 2, container_id="container-%d" % i,
+                         cpu=random.random(), mem=random.randint(0, 2 ** 30),
+                         read_and_write_bytes=[])
+            for counter in counters:
+                entry[counter] = sample * random.randint(0, 1000)
+            stats.append(entry)
+    stats.sort(key=lambda entry: entry["time"])
+    parser.individual_container_stats = stats
+    return parser
+
+
+def per_container_reference(parser):
+    """Previous implementation, filters the DataFrame once per container."""
+    dataframe = pandas.DataFrame(parser.individual_container_stats)
+    dataframe = dataframe.sort_values(by='time')
+
+    processed_individual = []
+    for container in parser._get_container_ids():
+        container_dataframe = dataframe[dataframe.container_id == container]
+        container_dataframe = container_dataframe[["time", "container_id", "cpu", "mem", "rx_bytes", "rx_packets",
+                                                   "rx_dropped", "tx_bytes", "tx_packets", "tx_dropped"]].copy()
+        container_dataframe["time_diff"] = container_dataframe.time.diff()
+        for column in ["rx_bytes", "rx_packets", "rx_dropped", "tx_bytes", "tx_packets", "tx_dropped"]:
+            container_dataframe[column] = container_dataframe[column].diff().divide(container_dataframe["time_diff"])
+        container_dataframe = container_dataframe.iloc[1:]
+        processed_individual += container_dataframe.to_dict('records')
+    return processed_individual
+
+
+@click.command()
+@click.option('--containers', type=int, multiple=True, default=[10, 100, 1000, 10000],
+              help="Number of containers (repeat option).")
+@click.option('--samples', type=int, default=20, help="Stats samples per container.")
+@click.option('--reference-limit', type=int, default=2000,
+              help="Skip the previous implementation above this many containers.")
+@click.option('--seed', type=int, default=42)
+def main(containers, samples, reference_limit, seed):
+    random.seed(seed)
+    click.echo("{:>12} {:>10} {:>12} {:>14} {:>10}".format(
+        "containers", "rows", "groupby (s)", "reference (s)", "identical"))
+
+    for n in containers:
+        parser = synthetic_parser(n, samples)
+        rows = len(parser.individual_container_stats)
+
+        reference_time, identical = None, None
+        if n <= reference_limit:
+            start = time.perf_counter()
+            reference = per_container_reference(parser)
+            reference_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parser._process_container_stats()
+        groupby_time = time.perf_counter() - start
+
+        if reference_time is not None:
+            identical = reference == parser.individual_container_stats
+
+        click.echo("{:>12} {:>10} {:>12.3f} {:>14} {:>10}".format(
+            n, rows, groupby_time,
+            "-" if reference_time is None else "{:.3f}".format(reference_time),
+            "-" if identical is None else str(identical)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark of the selection of the replicas hit by a fault.
+
+Spreads synthetic tasks of a service over nodes (grouped in racks), then
+times picking a fraction of them with each victim policy. The spread policy
+is compared with the previous selection, which looked for the node with the
+most tasks with max() and removed the victim from a list, for every victim.
+
+Run from src/master:
+    python -m benchmarks.victim_selection --replicas 2000 --replicas 20000
+"""
+import random
+import time
+
+import click
+
+from lsdsuite.engine.victims import VictimSelector, POLICIES, RACK_LABEL
+
+
+class FakeNode(object):
+    def __init__(self, node_id, rack):
+        self.id = node_id
+        self.labels = {RACK_LABEL: rack}
+
+
+class FakeTask(object):
+    def __init__(self, slot, node):
+        self.slot = slot
+        self.node = node
+        self.node_id = node.id
+
+
+def synthetic_tasks(replicas, nodes, racks):
+    cluster = [FakeNode("node-%d" % i, "rack-%d" % (i % racks)) for i in range(nodes)]
+    return [FakeTask(slot, random.choice(cluster)) for slot in range(1, replicas + 1)]
+
+
+def previous_selection(tasks, n):
+    """Previous implementation, max() and list.remove for every victim."""
+    tasks_by_node = {}
+    for t in tasks:
+        tasks_by_node.setdefault(t.node_id, []).append(t)
+    targets = []
+    for i in range(n):
+        node_tasks = max(tasks_by_node.values(), key=len)
+        t = random.choice(node_tasks)
+        targets.append(t)
+        node_tasks.remove(t)
+    return targets
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+@click.command()
+@click.option('--replicas', type=int, multiple=True, default=[2000, 20000, 100000],
+              help="Number of replicas of the service (repeat option).")
+@click.option('--nodes', type=int, default=100)
+@click.option('--racks', type=int, default=10)
+@click.option('--fraction', type=float, default=0.4, help="Fraction of the replicas hit.")
+@click.option('--reference-limit', type=int, default=20000,
+              help="Skip the previous selection above this many replicas.")
+@click.option('--seed', type=int, default=42)
+def main(replicas, nodes, racks, fraction, reference_limit, seed):
+    random.seed(seed)
+    policies = [policy for policy in POLICIES if policy != 'specific']
+    click.echo(("{:>10} {:>10}" + " {:>10}" * (len(policies) + 2)).format(
+        "replicas", "victims", "previous", *policies, "specific"))
+
+    for n_replicas in replicas:
+        tasks = synthetic_tasks(n_replicas, nodes, racks)
+        n = int(n_replicas * fraction)
+
+        previous = "-"
+        if n_replicas <= reference_limit:
+            previous = "{:.4f}".format(timed(previous_selection, tasks, n)[0])
+
+        times = []
+        for policy in policies:
+            elapsed, victims = timed(VictimSelector(tasks).select, n, policy)
+            assert len(victims) == n and len(set(map(id, victims))) == n
+            times.append("{:.4f}".format(elapsed))
+
+        slots = random.sample(range(n_replicas), n)
+        elapsed, victims = timed(VictimSelector(tasks).select, n, 'specific', slots)
+        assert len(victims) == n
+        times.append("{:.4f}".format(elapsed))
+
+        click.echo(("{:>10} {:>10}" + " {:>10}" * (len(times) + 1)).format(
+            n_replicas, n, previous, *times))
+
+
+if __name__ == '__main__':
+    main()
@@ -23,9 +23,40 @@ def get_config(config):
 
     config['slave_port'] = int(os.environ['LSDS_SLAVE_PORT'])
     config['ipam_port'] = int(os.environ['LSDS_IPAM_PORT'])
+    # keep-alive connections to each slave, and seconds to wait for an answer
+    config['slave_pool_size'] = int(os.environ.get('LSDS_SLAVE_POOL_SIZE', 4))
+    config['slave_timeout'] = float(os.environ.get('LSDS_SLAVE_TIMEOUT', 60))
+    # seconds the node list is reused by commands sent to all nodes
+    config['node_cache_ttl'] = float(os.environ.get('LSDS_NODE_CACHE_TTL', 30))
+    # seconds a node that accepted (or refused) SSH connections is not checked again
+    config['ssh_cache_ttl'] = float(os.environ.get('LSDS_SSH_CACHE_TTL', 60))
+    # seconds a listing of the tasks is reused when reading them
+    config['task_cache_ttl'] = float(os.environ.get('LSDS_TASK_CACHE_TTL', 1))
 
+    # networks or services of an app created at the same time
+    config['create_workers'] = int(os.environ.get('LSDS_CREATE_WORKERS', 8))
+
+    # seconds added to the measured lead time of a round start
+    config['start_margin'] = float(os.environ.get('LSDS_START_MARGIN', 0.5))
+    # threads running churn steps, and steps that can wait for one
+    config['churn_workers'] = int(os.environ.get('LSDS_CHURN_WORKERS', 16))
+    config['churn_max_pending'] = int(os.environ.get('LSDS_CHURN_MAX_PENDING', 1000))
     config['mono_kill'] = bool(os.environ.get('LSDS_MONO_KILL'))
     config['kill_batch'] = int(os.environ.get('LSDS_KILL_BATCH', 1000))
+    # how the master picks the replicas hit by a fault, see engine/victims.py
+    config['victim_policy'] = os.environ.get('LSDS_VICTIM_POLICY', 'spread')
+    # faults are injected by the master at each step, not by the slaves
+    config['master_driven'] = bool(os.environ.get('LSDS_MASTER_DRIVEN'))
+    config['results_format'] = os.environ.get('LSDS_RESULTS_FORMAT', 'json')
+    # 0 = one process per CPU
+    config['parse_processes'] = int(os.environ.get('LSDS_PARSE_PROCESSES', 0)) or None
+    config['log_fetch_workers'] = int(os.environ.get('LSDS_LOG_FETCH_WORKERS', 8))
+    config['log_fetch_retries'] = int(os.environ.get('LSDS_LOG_FETCH_RETRIES', 3))
+    # node logs are parsed directly, out.log is only kept for convenience
+    config['skip_merged_log'] = bool(os.environ.get('LSDS_SKIP_MERGED_LOG'))
+    # gzip node logs for the transfer, and/or keep them gzipped in the results
+    config['compress_logs'] = bool(os.environ.get('LSDS_COMPRESS_LOGS'))
+    config['keep_logs_compressed'] = bool(os.environ.get('LSDS_KEEP_LOGS_COMPRESSED'))
 
     # TODO: Check values (e.g. 0 < ports <= 65536)
     return config
@@ -7,7 +7,7 @@ import hashlib
 import lsdsuite
 from lsdsuite.benchmark import Benchmark
 from lsdsuite.engine.docker import Engine
-from lsdsuite.parser.parse import Parser
+from lsdsuite.parser.parse import Parser, OUTPUT_FORMATS
 from . import get_config
 
 from .__version__ import __version__
@@ -255,6 +255,12 @@ def _cluster_status(ctx):
               help="Waiting time at end of run.")
 @click.option('--dry-run', is_flag=True,
               help="Dry run experiment.")
+@click.option('--live-logs', is_flag=True,
+              help="Copy node logs during the run, not only at the end.")
+@click.option('--live-logs-interval', type=int, default=10,
+              help="Seconds between live log copies.")
+@click.option('--pipelined', is_flag=True,
+              help="Fetch and parse the logs of a run during the next run.")
 @click.pass_context
 def benchmark(ctx, **kwargs):
     """Runs benchmarks."""
@@ -277,7 +283,9 @@ def benchmark(ctx, **kwargs):
 
     bench = Benchmark(ctx.obj['engine'], ctx.obj['config'], ctx.obj['name'],
                       ctx.obj['app'], ctx.obj['churn'], ctx.obj['churn_string'],
-                      ctx.obj['run_time'], ctx.obj['start_time'], ctx.obj['end_time'])
+                      ctx.obj['run_time'], ctx.obj['start_time'], ctx.obj['end_time'],
+                      ctx.obj['live_logs'], ctx.obj['live_logs_interval'],
+                      ctx.obj['pipelined'])
 
     if ctx.obj['dry_run']:
         bench.start(dry_run=True)
@@ -293,7 +301,9 @@ def benchmark(ctx, **kwargs):
             except KeyboardInterrupt:
                 click.echo("Cleaning up before exit...")
                 bench.stop(wait=0, get_logs=False)
+                bench.finish(wait=False)
                 exit(1)
+        bench.finish()
 
 
 @cli.command('get_logs')
@@ -314,13 +324,18 @@ def cluster_gather_logs(ctx, **kwargs):
 @cli.command('process_logs')
 @click.option('--directory', type=str, required=True,
               help="If a bug happens and you want to rerun process logs")
-@click.option('--filename', type=str, required=True,
-              help="Main logs file")
+@click.option('--filename', type=str, required=True, multiple=True,
+              help="Main logs file, or each node log file (repeat option)")
+@click.option('--format', 'output_format', type=click.Choice(OUTPUT_FORMATS), default=None,
+              help="Format of the processed tables (default: LSDS_RESULTS_FORMAT).")
+@click.option('--processes', type=int, default=None,
+              help="Processes used to parse node logs (default: one per CPU).")
 @click.pass_context
 def process_logs_again(ctx, **kwargs):
     ctx.obj.update(kwargs)
 
-    parser = Parser(ctx.obj['filename'])
+    output_format = ctx.obj['output_format'] or ctx.obj['config']['results_format']
+    parser = Parser(ctx.obj['filename'], output_format, processes=ctx.obj['processes'])
     parser.process_file(ctx.obj['directory'])
 
 @cli.command('get_processed_events')
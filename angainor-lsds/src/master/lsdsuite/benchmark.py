@@ -5,6 +5,7 @@ import traceback
 from os.path import join
 
 from .churn import Churn
+from .log_shipper import LogShipper
 
 log = logging.getLogger(__name__)
 
@@ -13,12 +14,15 @@ log = logging.getLogger(__name__)
 # location (except if we mount the whole host filesystem into the container,
 # but this is obviously overkill).
 RESULTS_DIR = "./results"
-COMPRESS_LOGS = False
+
+# State of each run, in the results folder of the benchmark
+MANIFEST_FILE = "manifest.json"
 
 
 class Benchmark(object):
     def __init__(self, engine, config, name, spec, churn=None,
-                 churn_string=None, run_time=None, start_time=0, end_time=0):
+                 churn_string=None, run_time=None, start_time=0, end_time=0,
+                 live_logs=False, live_logs_interval=10, pipelined=False):
         from datetime import datetime
         self.date = datetime.now().replace(microsecond=0)
 
@@ -33,12 +37,29 @@ class Benchmark(object):
             raise ValueError("Either churn or run_time must be specified!")
 
         if churn:
-            churn = Churn(churn)
+            # victims are picked by the master only when it injects the faults
+            churn = Churn(churn, config['victim_policy'] if config['master_driven'] else None)
             faults_folder_in_host = self.config["faults_folder_host"]
             faults_folder_in_container = self.config["faults_folder_container"]
             self._inject_faults_volumes(spec, faults_folder_in_host, faults_folder_in_container)
             self._inject_none_restart_policy(spec)
-            answer_list = self.engine.parallel_send_command("churn_string", **{"churn_string": churn_string})
+            # the timeline is compiled once here, slaves only load the plan
+            master_driven = config['master_driven']
+            if not master_driven and any(getattr(step, 'target_details', {}).get('policy')
+                                         for step in churn.timeline if hasattr(step, 'slots')):
+                log.warning("Victim policies of churn targets are only used in master driven mode")
+            answer_list = self.engine.parallel_send_command("churn_plan", plan=churn.plan_string(master_driven))
+            if any(status != 'ok' and 'unknown command' in str(msg) for status, msg in answer_list):
+                if master_driven:
+                    # the slaves would inject the faults as well
+                    raise ValueError("Master driven churn needs slaves that support compiled churn plans")
+                if churn.generated:
+                    # the expanded moments can be far too many to be sent as
+                    # a churn specification
+                    raise ValueError("Churn with real traces or generators needs slaves that support "
+                                     "compiled churn plans")
+                log.warning("Some slaves don't support compiled churn plans, sending them the churn instead")
+                answer_list = self.engine.parallel_send_command("churn_string", **{"churn_string": churn_string})
             # check all answers?
             for status, msg in answer_list:
                 if status != 'ok':
@@ -54,6 +75,19 @@ class Benchmark(object):
         self.app = None
         self.run = 0
 
+        # ship logs from nodes while the run is running
+        self.live_logs = live_logs
+        self.live_logs_interval = live_logs_interval
+        self.log_shipper = None
+        # uncompressed size of the local node logs, see _local_log_size
+        self._log_sizes = {}
+
+        # process the logs of a run in the background during the next run
+        self.pipelined = pipelined
+        self._processor = None
+        self._processing = None
+        self.manifest = Manifest(join(RESULTS_DIR, self.benchmark_dir, MANIFEST_FILE), name)
+
     @property
     def log_file(self):
         return ("{date}--{name}--run-{run}.log"
@@ -61,12 +95,13 @@ class Benchmark(object):
                         name=self.name,
                         run=self.run))
 
+    @property
+    def benchmark_dir(self):
+        return "{date}--{name}".format(date=self.date.isoformat(), name=self.name)
+
     @property
     def results_dir(self):
-        from os.path import join
-        return join("{date}--{name}".format(date=self.date.isoformat(),
-                                            name=self.name),
-                    "run-{run}".format(run=self.run))
+        return join(self.benchmark_dir, "run-{run}".format(run=self.run))
 
     @property
     def mark(self):
@@ -84,9 +119,14 @@ class Benchmark(object):
 
         self.run += 1
         log.info("%s: starting run %d", self, self.run)
+        self.manifest.update(self.run, state='running', results_dir=self.results_dir,
+                             started=time.time())
         # TODO: make this more engine-agnostic
         # maybe move it to engine.create_app
         self.engine.send('log', file=self.log_file)
+        if self.live_logs:
+            self.log_shipper = LogShipper(self, self.live_logs_interval)
+            self.log_shipper.start()
 
         msg = dict(self.mark, status="start")
         self.engine.send('mark', msg=json.dumps(msg))
@@ -119,64 +159,220 @@ class Benchmark(object):
         if self.app is None:
             return
 
-        self.app.remove()
-        log.info("%s: waiting %ds for services to shut down", self, wait)
-        time.sleep(wait)
+        log.info("%s: waiting up to %ds for services to shut down", self, wait)
+        if not self.app.remove(wait):
+            log.warning("%s: services still shutting down after %ds", self, wait)
         self.app = None
 
         msg = dict(self.mark, status="stop")
         self.engine.send('mark', msg=json.dumps(msg))
         self.engine.send('log', file=None)
+        if self.log_shipper is not None:
+            # log files are closed, get_logs fetches what is left
+            self.log_shipper.stop()
+            self.log_shipper = None
 
         log.info("%s: end of run %d", self, self.run)
-
-        if get_logs:
-            self.get_logs()
+        self.manifest.update(self.run, stopped=time.time())
 
         if self.churn:
+            from os import makedirs
+
+            # asks the slaves, before the next run resets them
             path = RESULTS_DIR  # abspath(RESULTS_DIR)
             experiment_results_folder = join(path, self.results_dir)
+            makedirs(experiment_results_folder, exist_ok=True)
 
             self.churn.stop(self.engine, experiment_results_folder)
 
+        if not get_logs:
+            self.manifest.update(self.run, state='aborted')
+        elif self.pipelined:
+            self._process_in_background()
+        else:
+            self._process()
+
+    def _process(self):
+        self.manifest.update(self.run, state='processing')
+        try:
+            process_run(self)
+        except Exception as e:
+            self.manifest.update(self.run, state='failed', error=str(e))
+            raise
+        self.manifest.update(self.run, state='done', processed=time.time())
+
+    def _process_in_background(self):
+        """Fetches and parses the logs of the run in a background process.
+
+        The run waits for its turn while the previous one is processed, so
+        that at most one run is waiting.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+        import multiprocessing
+
+        if self._processing is not None and not self._processing.done():
+            log.info("%s: waiting for the logs of the previous run to be processed", self)
+            self._processing.exception()
+
+        run = self.run
+        self.manifest.update(run, state='processing')
+        log.info("%s: processing logs of run %d in the background", self, run)
+        for attempt in range(2):
+            if self._processor is None:
+                # not forked, the master has threads of its own (slave
+                # connections, task state, ...)
+                self._processor = ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_logging, initargs=(log.getEffectiveLevel(),))
+            try:
+                self._processing = self._processor.submit(process_run, self.detached())
+                break
+            except BrokenProcessPool:
+                log.warning("%s: background process died, starting a new one", self)
+                self._processor = None
+        else:
+            log.warning("%s: can't start a background process, processing logs of run %d now",
+                        self, run)
+            self._processing = None
+            self._process()
+            return
+        self._processing.add_done_callback(lambda future: self._processed(run, future))
+
+    def _processed(self, run, future):
+        error = future.exception()
+        if error is not None:
+            log.error("%s: processing logs of run %d failed: %s", self, run, error)
+            self.manifest.update(run, state='failed', error=str(error))
+        else:
+            log.info("%s: logs of run %d processed", self, run)
+            self.manifest.update(run, state='done', processed=time.time())
+
+    def finish(self, wait=True):
+        """Waits for the runs processed in the background and logs the
+        throughput of the benchmark.
+        """
+        if self._processor is not None:
+            self._processor.shutdown(wait=wait, cancel_futures=not wait)
+            self._processor = None
+        log.info("%s: %d runs done, %.1f runs per hour", self,
+                 self.manifest.count('done'), self.manifest.runs_per_hour())
+
+    def detached(self):
+        """Copy of the benchmark for the current run, without the engine nor
+        the churn, that can be sent to another process.
+        """
+        from copy import copy
+
+        clone = copy(self)
+        clone.engine = clone.churn = clone.app = clone.log_shipper = None
+        clone.manifest = clone._processor = clone._processing = None
+        clone._log_sizes = dict(self._log_sizes)
+        return clone
+
     def manual_get_logs(self, local_folder, remote_file_name):
-        import gzip
         from os import makedirs
-        from os.path import abspath, join
-        from shutil import copyfileobj
-        from glob import iglob
-        from subprocess import run
+        from os.path import join
+        from . import get_ssh
+        from .parser.merge import write_merged_log
 
         log.info("%s: fetching logs", self)
-        for i, node in enumerate(self.nodes):
-            local_path = local_folder
-            makedirs(local_path, exist_ok=True)
-            output_path = join(local_path, "{i}.log".format(i=i))
+        local_path = local_folder
+        makedirs(local_path, exist_ok=True)
+        name = "{i}.log.gz" if self.config['keep_logs_compressed'] else "{i}.log"
+        paths = [join(local_path, name.format(i=i)) for i in range(len(self.nodes))]
+
+        def fetch(node, i, progress):
+            with get_ssh(node) as ssh:
+                self._copy_log(ssh, paths[i], remote_file_name, progress)
 
-            self._get_logs_ssh(node, output_path, remote_file_name)
-        out = join(local_path, "out.log")
+        self._fetch_all_logs(fetch)
 
-        run(["sort", "-o", out, "-m", *iglob("*.log")], check=True)
-        log.info("%s: logs saved to %s", self, out)
+        if not self.config['skip_merged_log']:
+            out = join(local_path, "out.log")
+            write_merged_log(paths, out)
+            log.info("%s: logs saved to %s", self, out)
 
     def get_logs(self):
         from os.path import join
-        from glob import iglob
-        from subprocess import run
+        from .parser.merge import write_merged_log
 
         log.info("%s: fetching logs", self)
-        for i, node in enumerate(self.nodes):
-            self._get_logs(node, i)
+        self._fetch_all_logs(self._get_logs)
+
+        if not self.config['skip_merged_log']:
+            # merge
+            path = RESULTS_DIR  # abspath(RESULTS_DIR)
+            path = join(path, self.results_dir)
+            out = join(path, "out.log")
 
-        # merge
+            write_merged_log(self.node_log_paths, out)
+            log.info("%s: logs saved to %s", self, out)
+
+    @property
+    def node_log_paths(self):
         path = RESULTS_DIR  # abspath(RESULTS_DIR)
-        path = join(path, self.results_dir)
+        path = join(path, self.results_dir, "nodes")
+        name = "{i}.log.gz" if self.config['keep_logs_compressed'] else "{i}.log"
+        return [join(path, name.format(i=i)) for i in range(len(self.nodes))]
+
+    def _fetch_all_logs(self, fetch):
+        """Calls `fetch(node, i, progress)` for every node, concurrently.
+
+        At most `log_fetch_workers` nodes are fetched at the same time and
+        each node is retried up to `log_fetch_retries` times. The progress of
+        all transfers is aggregated and logged periodically.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from paramiko import SSHException
+
+        retries = self.config['log_fetch_retries']
+        progress = _TransferProgress(self, len(self.nodes))
+
+        def fetch_with_retries(node, i):
+            # one attempt, then the retries
+            for attempt in range(1, retries + 2):
+                try:
+                    fetch(node, i, progress.callback(i))
+                    return
+                except (SSHException, OSError, EOFError) as e:
+                    if attempt > retries:
+                        raise
+                    log.warning("%s: node %d: fetching logs failed (attempt %d/%d): %s",
+                                self, i, attempt, retries + 1, e)
+                    time.sleep(attempt)
+
+        workers = self.config['log_fetch_workers']
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(fetch_with_retries, node, i)
+                       for i, node in enumerate(self.nodes)]
+
+        failed = []
+        for i, future in enumerate(futures):
+            error = future.exception()
+            if error is not None:
+                log.error("%s: node %d: could not fetch logs: %s", self, i, error)
+                failed.append(i)
+        if failed:
+            raise RuntimeError("Could not fetch logs of nodes: " + str(failed))
+
+    def parse_logs(self):
+        from .parser.parse import Parser
 
-        out = join(path, "out.log")
-        pat = join(path, "nodes", "*.log")
+        path = RESULTS_DIR  # abspath(RESULTS_DIR)
+        path = join(path, self.results_dir)
 
-        run(["sort", "-o", out, "-m", *iglob(pat)], check=True)
-        log.info("%s: logs saved to %s", self, out)
+        log.info("%s: parsing logs", self)
+        try:
+            # each node log is parsed in its own process and merged afterwards
+            parser = Parser(self.node_log_paths, self.config['results_format'],
+                            processes=self.config['parse_processes'])
+            parser.process_file(path)
+        except Exception:
+            # Parsing can be re-run later with the process_logs command
+            log.warning("%s: could not parse logs in %s", self, path, exc_info=1)
+            return
+        log.info("%s: parsed logs saved to %s", self, path)
 
     def _inject_faults_volumes(self, spec, faults_folder_in_host, faults_folder_in_container):
         services = spec.get('services')
@@ -200,56 +396,259 @@ class Benchmark(object):
             log.debug("Making restart policy None for service [name]".format(name=name))
             self.engine.make_restart_policy_none(service)
 
-    def _get_logs(self, node, i):
-        import gzip
-        from os import makedirs
-        from os.path import abspath, join
-        from shutil import copyfileobj
-
-        remote_path = abspath(self.lsds_dir)
-        remote_path = join(remote_path, "logs", self.log_file)
-
-        local_path = RESULTS_DIR  # abspath(RESULTS_DIR)
-        local_path = join(local_path, self.results_dir, "nodes")
-        makedirs(local_path, exist_ok=True)
-        output_path = join(local_path, "{i}.log".format(i=i))
-
-        if COMPRESS_LOGS:
-            local_path = join(local_path, "{i}.log.gz".format(i=i))
-        else:
-            local_path = output_path
-
-        log.debug("%s: node %d: fetching logs from %s to %s",
-                  self, i, remote_path, local_path)
-
-        if i == 0 and not node.get('remote'):
-            self._get_logs_local(node, local_path, remote_path)
-        else:
-            self._get_logs_ssh(node, local_path, remote_path)
-
-        if COMPRESS_LOGS:
-            with open(output_path, 'wb') as f:
-                with gzip.open(local_path, 'rb') as g:
-                    copyfileobj(g, f)
+    @property
+    def remote_log_path(self):
+        from os.path import abspath
+        return join(abspath(self.lsds_dir), "logs", self.log_file)
 
-    def _get_logs_local(self, node, local_path, remote_path):
-        from shutil import copy
-        copy(remote_path, local_path)
+    @staticmethod
+    def is_local_node(node, i):
+        """The first node is the one lsdsuite runs on, unless marked remote."""
+        return i == 0 and not node.get('remote')
 
-    def _get_logs_ssh(self, node, local_path, remote_path):
+    def _get_logs(self, node, i, progress=None):
         from . import get_ssh
 
-        def progress(i, total):
-            # show update every 10%
-            current = int(10 * i/total) * 10
-            if current != progress.cnt:
-                progress.cnt = current
-                log.debug("%s: SSH progress: %3.0f%%", self, 100 * i/total)
-        progress.cnt = -1
-        with get_ssh(node) as ssh:
-            sftp = ssh.open_sftp()
-            sftp.get(remote_path, local_path, callback=progress)
+        # with live logs, most of the log was already shipped during the run
+        local_path = self.node_log_paths[i]
+        if self.is_local_node(node, i):
+            self._copy_log(None, local_path, self.remote_log_path, progress, self.live_logs)
+        else:
+            with get_ssh(node) as ssh:
+                self._copy_log(ssh, local_path, self.remote_log_path, progress, self.live_logs)
+
+    def _copy_log(self, ssh, local_path, remote_path, progress=None, resume=False):
+        """Copies `remote_path` to `local_path`, over `ssh` unless it is None.
+
+        With `resume`, only the bytes that `local_path` doesn't have yet are
+        copied. The log is gzipped on the node for the transfer if
+        `compress_logs` is set, and node logs are stored gzipped if
+        `local_path` ends in .gz. Returns the number of (uncompressed) bytes
+        appended; progress is called with (bytes transferred, total bytes).
+        """
+        from os import makedirs
+        from os.path import dirname, getsize
+
+        makedirs(dirname(local_path), exist_ok=True)
+        offset = self._local_log_size(local_path) if resume else 0
+
+        log.debug("%s: fetching %s to %s from byte %d", self, remote_path, local_path, offset)
+        if ssh is None:
+            with open(remote_path, 'rb') as source:
+                return self._append_delta(source, getsize(remote_path), local_path, offset, progress)
+
+        with ssh.open_sftp() as sftp:
+            if self.config['compress_logs'] or local_path.endswith('.gz'):
+                size = sftp.stat(remote_path).st_size
+                return self._append_delta_gzip(ssh, remote_path, size, local_path, offset, progress)
+
+            with sftp.open(remote_path, 'rb') as source:
+                size = source.stat().st_size
+                return self._append_delta(source, size, local_path, offset, progress)
+
+    def _local_log_size(self, local_path):
+        """Uncompressed size of the local copy of a node log."""
+        from os.path import exists, getsize
+
+        if not exists(local_path):
+            return 0
+        if local_path.endswith('.gz'):
+            # unknown if written by someone else, which starts the copy over
+            return self._log_sizes.get(local_path, 0)
+        return getsize(local_path)
+
+    @staticmethod
+    def _open_local_log(local_path, offset):
+        mode = 'ab' if offset else 'wb'
+        if local_path.endswith('.gz'):
+            import gzip
+            # appending adds a gzip member, which gzip readers concatenate
+            return gzip.open(local_path, mode, compresslevel=6)
+        return open(local_path, mode)
+
+    def _append_delta(self, source, size, local_path, offset, progress=None, block_size=2 ** 20):
+        """Appends the bytes of `source` after `offset` to `local_path`.
+
+        Copying stops at `size` (the source size when the copy started).
+        Returns the number of bytes appended.
+        """
+        if offset > size:
+            # source was re-created, start over
+            offset = 0
+        if offset == size:
+            if progress is not None:
+                progress(size, size)
+            return 0
+
+        source.seek(offset)
+        if hasattr(source, 'prefetch'):
+            # SFTP file, request the blocks concurrently instead of one by one
+            source.prefetch(size)
+
+        copied = 0
+        with self._open_local_log(local_path, offset) as f:
+            while offset + copied < size:
+                data = source.read(min(block_size, size - offset - copied))
+                if not data:
+                    break
+                f.write(data)
+                copied += len(data)
+                if progress is not None:
+                    progress(offset + copied, size)
+
+        self._log_sizes[local_path] = offset + copied
+        return copied
+
+    def _append_delta_gzip(self, ssh, remote_path, size, local_path, offset, progress=None,
+                           block_size=2 ** 16):
+        """Same as `_append_delta`, but the bytes are gzipped on the node.
+
+        The gzip stream is written as is to a .gz `local_path` (one more gzip
+        member), and decompressed on the fly otherwise. A failed transfer
+        leaves `local_path` as it was.
+        """
+        import zlib
+        from shlex import quote
+
+        if offset > size:
+            offset = 0
+        length = size - offset
+        if length == 0:
+            if progress is not None:
+                progress(size, size)
+            return 0
+
+        # fastest level, logs compress well anyway and the node may be busy
+        command = "tail -c +{start} {path} | head -c {length} | gzip -c -1".format(
+            start=offset + 1, path=quote(remote_path), length=length)
+        stdin, stdout, stderr = ssh.exec_command(command)
+        stdin.close()
+
+        keep_compressed = local_path.endswith('.gz')
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        copied = 0
+        with open(local_path, 'ab' if offset else 'wb') as f:
+            start = f.tell()
+            try:
+                while True:
+                    data = stdout.read(block_size)
+                    if not data:
+                        break
+                    plain = decompressor.decompress(data)
+                    f.write(data if keep_compressed else plain)
+                    copied += len(plain)
+                    if progress is not None:
+                        progress(offset + copied, size)
+
+                status = stdout.channel.recv_exit_status()
+                if status != 0 or copied != length:
+                    raise IOError("Compressed transfer of {} failed ({}/{} bytes, exit status {}): {}"
+                                  .format(remote_path, copied, length, status,
+                                          stderr.read().decode(errors='replace').strip()))
+            except Exception:
+                f.truncate(start)
+                raise
+
+        self._log_sizes[local_path] = offset + copied
+        return copied
 
     def __repr__(self):
         return "Benchmark[{name}]".format(name=self.name)
 
+
+def process_run(benchmark):
+    """Fetches, merges and parses the logs of the current run of `benchmark`."""
+    benchmark.get_logs()
+    benchmark.parse_logs()
+
+
+def _init_logging(level):
+    logging.basicConfig()
+    for name in [__name__, 'lsdsuite.parser.parse']:
+        logging.getLogger(name).setLevel(level)
+
+
+class Manifest(object):
+    """State of the runs of a benchmark (running, processing, done, failed
+    or aborted) and when each step ended, saved after every change.
+    """
+
+    def __init__(self, path, name):
+        import threading
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {'name': name, 'started': time.time(), 'runs': {}}
+
+    def update(self, run, **fields):
+        with self.lock:
+            self.data['runs'].setdefault(str(run), {}).update(fields)
+            self.data['runs_per_hour'] = self._runs_per_hour()
+            self._save()
+
+    def count(self, state):
+        with self.lock:
+            return sum(run.get('state') == state for run in self.data['runs'].values())
+
+    def runs_per_hour(self):
+        with self.lock:
+            return self._runs_per_hour()
+
+    def _runs_per_hour(self):
+        processed = [run['processed'] for run in self.data['runs'].values()
+                     if run.get('state') == 'done']
+        if not processed:
+            return 0
+        return len(processed) * 3600 / max(max(processed) - self.data['started'], 1)
+
+    def _save(self):
+        from os import makedirs, replace
+        from os.path import dirname
+
+        makedirs(dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        replace(tmp, self.path)
+
+
+class _TransferProgress(object):
+    """Aggregated progress of the log transfers of all nodes.
+
+    Logged at most every `interval` seconds, and once all nodes are done.
+    """
+
+    def __init__(self, benchmark, n_nodes, interval=5):
+        import threading
+
+        self.benchmark = benchmark
+        self.n_nodes = n_nodes
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.transferred = {}
+        self.totals = {}
+        self.last_shown = None
+
+    def callback(self, i):
+        """Returns a paramiko-style callback for node `i`."""
+        def progress(transferred, total):
+            self.update(i, transferred, total)
+        return progress
+
+    def update(self, i, transferred, total):
+        with self.lock:
+            self.transferred[i] = transferred
+            self.totals[i] = total
+
+            done = sum(1 for n in self.totals if self.transferred[n] >= self.totals[n])
+            now = time.monotonic()
+            if done < self.n_nodes and self.last_shown is not None \
+                    and now - self.last_shown < self.interval:
+                return
+            self.last_shown = now
+
+            total = sum(self.totals.values())
+            transferred = sum(self.transferred.values())
+            log.info("%s: fetching logs: %3.0f%% of %.1f MiB, %d/%d nodes done",
+                     self.benchmark, 100 * transferred / total if total else 100,
+                     total / 2 ** 20, done, self.n_nodes)
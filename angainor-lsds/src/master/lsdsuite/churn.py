@@ -2,20 +2,22 @@ import json
 import logging
 import datetime
 import string
-
-import threading
+import random
 import time
+
 from os.path import join
 
-from utils.bubble_sort import bubbleSort
+from .scheduler import TimelineExecutor, StepExecutor
+from .churn_plan import compile_plan
 from .experiment_step import EndStep, SignalStep, KillFault, CPUFault, StartReplicasStep, \
-    StopReplicasStep, CustomFaultStep, FaultStep, BeginningStep
+    StopReplicasStep, CustomFaultStep, FaultStep, BeginningStep, MarkStep, \
+    DEFAULT_FILE_FOLDER, DEFAULT_EXECUTABLE
 
 log = logging.getLogger(__name__)
 
 
 class Churn(object):
-    def __init__(self, spec):
+    def __init__(self, spec, victim_policy=None):
         def error(name, msg):
             error = "Error in churn specification (service {name}): "
             error += msg
@@ -35,28 +37,42 @@ class Churn(object):
         #     raise ValueError(msg)
 
         log.debug("Starting parse")
+        # real traces and generators are expanded into regular moments
+        self.generated = any('real' in step or 'generate' in step for step in events)
+        self.seed = spec.get('environment', {}).get('seed')
+        if self.generated and self.seed is None:
+            # the expansion must be the same every time
+            self.seed = random.randrange(2 ** 32)
+            log.info("No environment seed, generating churn with seed %d", self.seed)
         log.debug("starting synthetic parse mode")
-        self.timeline = self._parse_synthetic(events)
-        # elif mode == 'real':
-        #     log.debug("starting real parse mode")
-        #     self.timeline = _parse_real("name", "churn['real']")
+        self.timeline = self._parse_synthetic(self._expand_events(events))
 
         # Sort by time ; maintain order otherwise
         def get_time(val):
             return val.time
 
-        # bubbleSort used in order to control the sort algorithm
-        # we will use bubble sort in master and slave
-        # no need to worry about performance because this only runs once per round,
-        # and with few items, generally already sorted
-        bubbleSort(self.timeline, get_time)
+        # stable sort, steps at the same time keep the order in which they
+        # were specified. The slaves sort their moments the same way
+        # (sort.Stable), so both agree on the order (and ids) of the steps
+        self.timeline.sort(key=get_time)
         self.certify_moments_before_end(self.timeline)
         self._process_moments_amounts(self.timeline)
+        # what the slaves execute, with the slots of every step resolved,
+        # unless the master picks them (`victim_policy`, master driven only)
+        self.plan = compile_plan(self.timeline, self.start_replicas, self.seed, victim_policy)
 
         log.debug("TimeLine")
         for event in self.timeline:
             log.debug("   " + str(event))
 
+        self.executor = TimelineExecutor()
+        self.step_results = []
+        # measured when scheduling the start of a round
+        self.ntp_offsets = None
+        self.rtts = {}
+        self.start_report = None
+        # faults injected by the master, with the delay to their acknowledgment
+        self.fault_acks = []
         log.debug("Parse completed")
 
     def process_stop(self, app, step, step_number, number_steps, interactive, dry_run):
@@ -80,7 +96,16 @@ class Churn(object):
             return
 
         service = app.service(name=service_name)
-        service.rm(number_replicas)
+        # the containers of the slots the compiled plan marked as dead, so
+        # that later steps find the slots they target, unless the victims
+        # are chosen by a policy
+        slots = getattr(step, 'slots', None)
+        answers = service.stop(number_replicas, slots=slots, policy=step.target_details.get('policy'))
+        stopped = [t for _, batch, status, _ in answers if status == 'ok' for t in batch]
+        self._register_injected(step, slots, stopped)
+        if len(stopped) < number_replicas:
+            raise ValueError("stop done in {} of {} replicas of {}".format(
+                len(stopped), number_replicas, service_name))
 
     def process_add(self, app, step, step_number, number_steps, interactive, dry_run):
         if not isinstance(step, StartReplicasStep):
@@ -123,16 +148,58 @@ class Churn(object):
                 "IGNORING Churn step %d/%d, Fault: %s in %d instances of %s",
                 step_number, number_steps, step.operation,  number_replicas, service_name)
             return
-        else:
-            # oops.. TODO
-            log.error("Implement Process Fault.. TODO.. FAULT NOT INJECTED")
+
+        log.info("Churn step %d/%d, injecting %s in %d instances of %s",
+                 step_number, number_steps, step.operation, number_replicas, service_name)
+        if dry_run:
             return
-        # log.info("Churn step %d/%d, injecting %s (custom) in %d instances of %s",
-        #          step_number, number_steps, step.fault_file_name, number_replicas, service_name)
-        #
-        # service = app.service(name=service_name)
-        # service.custom_fault(number_replicas=number_replicas,
-        #                      fault_details=fault_details, fault_arguments=fault_arguments, wait=False)
+
+        service = app.service(name=service_name)
+        # the replicas picked when the plan was compiled, or none when the
+        # victim policy needs to know where replicas run (see compile_plan)
+        policy = step.target_details.get('policy')
+        slots = getattr(step, 'slots', None)
+        dispatched = time.monotonic()
+        if isinstance(step, KillFault):
+            answers = service.kill(number_replicas, signal='SIGKILL', slots=slots, policy=policy)
+        elif isinstance(step, SignalStep):
+            answers = service.kill(number_replicas, signal=step.signal.upper(), slots=slots, policy=policy)
+        else:
+            fault_details, fault_arguments = _fault_command(step)
+            answers = service.custom_fault(number_replicas, fault_details, fault_arguments, slots=slots,
+                                           policy=policy)
+        acked = time.monotonic()
+
+        injected = [t for _, batch, status, _ in answers if status == 'ok' for t in batch]
+        self._register_injected(step, slots, injected)
+
+        deadline = self.executor.deadline(step.time)
+        self.fault_acks.append({
+            'step': step_number,
+            'time': step.time,
+            'operation': step.operation,
+            'service': service_name,
+            'replicas': number_replicas,
+            'injected': len(injected),
+            'batches': len(answers),
+            'dispatch': dispatched - deadline,
+            'ack': acked - deadline,
+        })
+        if len(injected) < number_replicas:
+            raise ValueError("{} injected in {} of {} replicas of {}".format(
+                step.operation, len(injected), number_replicas, service_name))
+
+    def _register_injected(self, step, slots, tasks):
+        """Registers the ids of the container actions of `step` done in
+        `tasks`: one id per slot of the plan, in order.
+        """
+        if slots is not None:
+            index = {slot + 1: i for i, slot in enumerate(slots)}
+            ids = [step.get_id() + index[t.slot] for t in tasks]
+        else:
+            ids = [step.get_id() + i for i in range(len(tasks))]
+        for step_id in ids:
+            self.register_id_processed(step_id)
 
     def process_beginning(self, app, step, step_number, number_steps, interactive, dry_run):
         if not isinstance(step, BeginningStep):
@@ -141,6 +208,13 @@ class Churn(object):
         step_id = step.get_id()
         self.register_id_processed(step_id)
 
+    def process_mark(self, app, step, step_number, number_steps, interactive, dry_run):
+        if not isinstance(step, MarkStep):
+            raise ValueError("Misconstructed Step:", step)
+        log.info("Churn step %d/%d: Mark %s", step_number, number_steps, step.message)
+        step_id = step.get_id()
+        self.register_id_processed(step_id)
+
 
 
     # dictionary that helps select which function to call, depending on type of step
@@ -149,6 +223,7 @@ class Churn(object):
         'start': process_add,
         'end': process_end,
         'beginning': process_beginning,
+        'mark': process_mark,
         'cpu': process_fault,
         'custom': process_fault,
         'signal': process_fault,
@@ -175,63 +250,157 @@ class Churn(object):
             service['deploy'] = service.get('deploy', {})
             service['deploy']['replicas'] = n
 
-    # this function will arrange with slaves a start moment and will return at the start moment
+    # this function will arrange with slaves a start moment and will return it
     def _schedule_start(self, engine, start_in_N_seconds):
-        no_error = False
-        number_attempts = 0
-        while not no_error and number_attempts < 5:
-            if number_attempts > 0:
-                start_in_N_seconds *= 2
-            no_error = True
-            number_attempts += 1
-            # TODO create timeout
-            # at the moment it waits for answer or socket close
-            answer_list = engine.parallel_send_command("restart_round")
-            for status, msg in answer_list:
-                if status != 'ok':
-                    log.warning("Error when trying to reset status in slave: " + str(msg))
-                    no_error = False
-            if not no_error:
-                continue
-
-            start_date = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=start_in_N_seconds)
-            log.info("Trying to start the experiment round @ " + str(start_date))
+        """Agrees on the start moment of the round with the slaves.
+
+        The lead time is the smallest that lets every slave get the start
+        moment before it passes on its own clock: twice the slowest command
+        round trip and twice the largest NTP offset, plus `start_margin`.
+        `start_in_N_seconds` is used if the offsets are unknown, and the lead
+        time is doubled after every failed attempt.
+        """
+        nodes = engine.cached_nodes()
+        lead = self._lead_time(engine, nodes, start_in_N_seconds)
+
+        for attempt in range(1, 6):
+            if attempt > 1:
+                lead *= 2
+
+            start_date = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=lead)
+            log.info("Trying to start the experiment round @ %s (in %.3fs)", start_date, lead)
             start_date_string = start_date.astimezone().isoformat()
 
-            answer_list = engine.parallel_send_command("start_run_at", datetime=start_date_string)
-            for status, msg in answer_list:
+            # both commands are sent at once, an answer after the start moment is useless
+            answers = engine.run_coroutine(engine.async_send_commands(
+                [("restart_round", {}, {}), ("start_run_at", {}, {"datetime": start_date_string})],
+                nodes, timeout=lead))
+            slack = (start_date - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+
+            no_error = True
+            planned = []
+            for node, ((reset_status, reset_msg), (status, msg)) in zip(nodes, answers):
+                if reset_status != 'ok':
+                    log.warning("Error when trying to reset status in slave %s: %s", node, reset_msg)
+                    no_error = False
                 if status != 'ok':
-                    log.warning("Error when trying to schedule start moment in slave: " + str(msg))
+                    log.warning("Error when trying to schedule start moment in slave %s: %s", node, msg)
                     no_error = False
+                else:
+                    planned.append(node)
 
-            if not no_error:
-                continue
-
-            now_date = datetime.datetime.now(datetime.timezone.utc)
-            log.debug("Planning start @ " + start_date.__str__())
-            missing_time = start_date - now_date
-            sleep_seconds = missing_time.total_seconds()
-            if sleep_seconds < 0:
-                answer_list = engine.parallel_send_command("cancel_run")
-                for status, msg in answer_list:
-                    if status != 'ok':
-                        error_message = "Cancel Round Failed. The experiment is out of control. Please consider turning restarting the cluster. error: " + str(msg)
-                        log.error(error_message)
-                        raise ValueError(error_message)
+            if slack < 0:
                 # we missed our deadline ..
                 log.warning("Error while scheduling start of next run, we missed start moment")
                 no_error = False
-                # duplicate the time window to start the experiment
-                continue
 
-            else:
-                log.info("Sleeping: " + str(sleep_seconds) + " until round start")
-                time.sleep(sleep_seconds)
-
-        if not no_error:
-            error_message = "Failed to start run"
-            log.error(error_message)
-            raise ValueError(error_message)
+            if no_error:
+                self._report_start(nodes, start_date, lead, slack, attempt)
+                return start_date
+
+            if planned:
+                self._cancel_run(engine, planned)
+
+        error_message = "Failed to start run"
+        log.error(error_message)
+        raise ValueError(error_message)
+
+    def _lead_time(self, engine, nodes, default):
+        # the first answer (status) gives the round trip time of each slave,
+        # NTP offsets only change slowly, they are measured once
+        commands = [("status", {}, {})]
+        if self.ntp_offsets is None:
+            commands.append(("ntp_offset", {}, {}))
+        answers = engine.run_coroutine(engine.async_send_commands(commands, nodes))
+
+        self.rtts = {}
+        for node, node_answers in zip(nodes, answers):
+            status, msg = node_answers[0]
+            if status != 'ok':
+                log.warning("Slave %s unreachable: %s", node, msg)
+                return default
+            self.rtts[node.hostname] = engine.slave_pool(node.ip).rtt
+
+        if self.ntp_offsets is None:
+            offsets = {}
+            for node, node_answers in zip(nodes, answers):
+                status, msg = node_answers[1]
+                if status != 'ok':
+                    log.warning("No NTP offset for %s, using a %ss lead time: %s", node, default, msg)
+                    return default
+                # in milliseconds
+                offsets[node.hostname] = float(msg) / 1000
+            self.ntp_offsets = offsets
+
+        max_rtt = max(self.rtts.values())
+        max_offset = max(abs(offset) for offset in self.ntp_offsets.values())
+        lead = 2 * max_rtt + 2 * max_offset + engine.config['start_margin']
+        log.debug("Lead time %.3fs: max RTT %.1fms, max NTP offset %.1fms",
+                  lead, max_rtt * 1000, max_offset * 1000)
+        return lead
+
+    def _report_start(self, nodes, start_date, lead, slack, attempts):
+        # slaves start at the start moment of their own clock, the spread of
+        # their offsets is only an estimate of the skew, see _measure_start
+        offsets = self.ntp_offsets or {}
+        skew = max(offsets.values()) - min(offsets.values()) if offsets else None
+        self.start_report = {
+            'start': start_date.isoformat(),
+            'lead': lead,
+            'slack': slack,
+            'attempts': attempts,
+            'estimated_skew': skew,
+            'rtts': self.rtts,
+            'ntp_offsets': offsets,
+        }
+        if skew is None:
+            log.info("Round start agreed with %d nodes, %.3fs before it", len(nodes), slack)
+        else:
+            log.info("Round start agreed with %d nodes, %.3fs before it, "
+                     "estimated start skew across nodes (NTP offsets) %.1fms",
+                     len(nodes), slack, skew * 1000)
+
+    def _measure_start(self, engine):
+        """Adds to the start report when each slave actually started the
+        round, on its own clock and corrected by its NTP offset, and the
+        spread of the corrected times (the achieved start skew).
+        """
+        nodes = engine.cached_nodes()
+        answers = engine.run_coroutine(engine.async_send_command("round_started", nodes))
+        planned = datetime.datetime.fromisoformat(self.start_report['start'])
+        offsets = self.ntp_offsets or {}
+
+        delays = {}
+        corrected = {}
+        for node, (status, msg) in zip(nodes, answers):
+            if status != 'ok':
+                log.warning("No round start time from %s: %s", node, msg)
+                continue
+            started = datetime.datetime.fromisoformat(msg.replace('Z', '+00:00'))
+            # how late the slave's timer fired, on its own clock
+            delays[node.hostname] = (started - planned).total_seconds()
+            if node.hostname in offsets:
+                # NTP offset is the reference time minus the node's time
+                corrected[node.hostname] = delays[node.hostname] + offsets[node.hostname]
+
+        skew = max(corrected.values()) - min(corrected.values()) if len(corrected) > 1 else None
+        self.start_report.update(start_delays=delays, start_times=corrected, skew=skew)
+        if skew is None:
+            log.info("Round start skew not measured, %d/%d slaves reported their start",
+                     len(corrected), len(nodes))
+        else:
+            log.info("Round started on %d/%d nodes, measured start skew across nodes %.1fms, "
+                     "latest start %.1fms after the start moment", len(corrected), len(nodes),
+                     skew * 1000, max(corrected.values()) * 1000)
+
+    @staticmethod
+    def _cancel_run(engine, nodes):
+        answers = engine.run_coroutine(engine.async_send_command("cancel_run", nodes))
+        for status, msg in answers:
+            if status != 'ok':
+                error_message = "Cancel Round Failed. The experiment is out of control. Please consider turning restarting the cluster. error: " + str(msg)
+                log.error(error_message)
+                raise ValueError(error_message)
 
     def register_id_processed(self, id):
         self.processed_ids += [id]
@@ -245,22 +414,27 @@ class Churn(object):
     def start(self, engine, app, dry_run=False, start_in_N_seconds=2):
         if dry_run:
             app.send_dry_run_to_all_nodes()
+            self.executor = TimelineExecutor()
         else:
-            self._schedule_start(engine, start_in_N_seconds)
+            # steps are due relative to the start agreed with the slaves
+            start_date = self._schedule_start(engine, start_in_N_seconds)
+            self.executor = TimelineExecutor.at_wall_clock(start_date)
         # else:
         #     app.send_start_to_all_nodes()
 
-        last_t = 0
         n_steps = len(self.timeline)
         total_time = self.timeline[-1].time
         log.info("Starting experiment: " + str(datetime.datetime.now()))
         log.info("Churn steps: %d, duration %ds", n_steps, total_time)
         self.reset_processed_ids()
+        self.fault_acks = []
+        # the master injects the faults itself, the slaves only have the marks
+        interactive = engine.config['master_driven']
+        workers = StepExecutor(engine.config['churn_workers'], engine.config['churn_max_pending'])
         for step_number, step in enumerate(self.timeline, 1):
             step_time = step.time
             operation = step.operation
-            sleep = max(0, step_time - last_t)
-            last_t = step_time
+            sleep = max(0, self.executor.remaining(step_time))
             now_date = datetime.datetime.now()
             next_step_date = now_date + datetime.timedelta(seconds=sleep)
             log.info("%s Churn step %d/%d, sleeping for %ds until %s",
@@ -270,21 +444,27 @@ class Churn(object):
             if dry_run:
                 continue
 
-            time.sleep(sleep)
+            self.executor.wait(step_number, step_time)
             if operation not in self.process_functions.keys():
                 # else:
                 log.warning("Churn step %d, ignoring UNSUPPORTED step: %s",
                             step_number, step)
                 continue
 
+            if isinstance(step, EndStep):
+                # every other step must be done before the end of the experiment
+                workers.join()
+
             function = self.process_functions[operation]
-            t = threading.Thread(target=function,
-                                 args=(self, app, step, step_number,
-                                       n_steps, False, dry_run),
-                                 name=str(step))
-            t.start()
+            # steps of the same service run in order, one at a time
+            workers.submit(getattr(step, 'service_name', None), step_number, step,
+                           function, self, app, step, step_number, n_steps, interactive, dry_run)
             # function(app, step, step_number, n_steps, interactive=False, dry_run)
 
+        workers.shutdown()
+        self.step_results = workers.results
+        self.executor.log_report()
+
     def stop(self, engine, experiment_results_folder):
         master_processed_ids = self.get_processed_ids()
         events, maxID, hosts_list = engine.get_processed_events()
@@ -384,6 +564,35 @@ class Churn(object):
         with open(path, 'w') as outfile:
             json.dump(events, outfile)
 
+        failed = [result for result in self.step_results if not result.ok]
+        log.info("Churn steps: %d run, %d failed", len(self.step_results), len(failed))
+        for result in sorted(failed, key=lambda result: result.step_number):
+            log.error("Churn step %d failed: %s: %r", result.step_number, result.step, result.error)
+
+        path = join(experiment_results_folder, "step_results.json")
+        with open(path, 'w') as outfile:
+            json.dump([result.to_dict() for result in
+                       sorted(self.step_results, key=lambda result: result.step_number)], outfile)
+
+        if self.fault_acks:
+            delays = sorted(ack['ack'] for ack in self.fault_acks)
+            log.info("Faults acknowledged after the step deadline: mean %.1fms, p50 %.1fms, max %.1fms",
+                     sum(delays) / len(delays) * 1000, delays[len(delays) // 2] * 1000, delays[-1] * 1000)
+            path = join(experiment_results_folder, "fault_acks.json")
+            with open(path, 'w') as outfile:
+                json.dump(self.fault_acks, outfile)
+
+        if self.start_report is not None:
+            self._measure_start(engine)
+            path = join(experiment_results_folder, "round_start.json")
+            with open(path, 'w') as outfile:
+                json.dump(self.start_report, outfile)
+
+        # how late each step was dispatched
+        path = join(experiment_results_folder, "step_lateness.json")
+        with open(path, 'w') as outfile:
+            json.dump(self.executor.summary(), outfile)
+
         if len(not_processed_events) > 0 :
             log.error("At least one of the events was not processed.. NOT PROCESSED:" + str(not_processed_events))
 
@@ -425,6 +634,49 @@ class Churn(object):
             log.debug("----------------------------------")
 
 
+    def plan_string(self, master_driven=False):
+        """Compiled plan, as sent to the slaves.
+
+        When the master injects the faults, the slaves don't get the
+        container actions.
+        """
+        plan = self.plan
+        if master_driven:
+            plan = dict(plan, actions=[action for action in plan['actions']
+                                       if action['k'] != 'container'])
+        return json.dumps(plan, separators=(',', ':'))
+
+    def _expand_events(self, steps):
+        """Yields the churn events, with `real` and `generate` steps replaced
+        by the moments they expand to.
+        """
+        from .churn_generator import generate_moments
+
+        end = next((step['end'] for step in steps if 'end' in step), None)
+        start_replicas = {}
+        for index, step in enumerate(steps):
+            if 'beginning' in step:
+                start_replicas.update(step['beginning'])
+
+            if 'real' in step:
+                spec = step['real']
+                log.debug("starting real parse mode: %s", spec)
+                try:
+                    moments = _parse_real(spec, int(start_replicas.get(spec.get('service'), 0)))
+                except ValueError as e:
+                    raise ValueError("Error in churn specification (real step: {}): {}".format(spec, e))
+                yield from moments
+            elif 'generate' in step:
+                spec = step['generate']
+                # each generator gets its own random sequence
+                seed = "{}-{}".format(self.seed, index)
+                try:
+                    yield from generate_moments(spec, seed, end)
+                except ValueError as e:
+                    raise ValueError("Error in churn specification (generate step: {}): {}".format(spec, e))
+            else:
+                yield step
+
     def _parse_synthetic(self, steps):
         # self.timeline += service['steps']
         # self.timeline.append((service['end'], name, 'end', 0, None))
@@ -494,7 +746,7 @@ def _parse_moment(step):
 
     faults = []
     if moment.get('mark', None):
-        mark_step = BeginningStep(fault_time)
+        mark_step = MarkStep(fault_time, moment['mark'])
         faults.append(mark_step)
 
     if moment.get('services', None) is not None:
@@ -524,6 +776,31 @@ def _parse_moment(step):
     return faults
 
 
+def _fault_command(step):
+    """Returns the parameters of the slave `custom` command of a fault step."""
+    if isinstance(step, CPUFault):
+        fault_details = {
+            'fault_file_name': "waste_cpu",
+            'fault_file_folder': DEFAULT_FILE_FOLDER,
+            'executable': DEFAULT_EXECUTABLE,
+        }
+        fault_arguments = {
+            'executable_arguments': [],
+            'fault_script_arguments': [str(step.duration)],
+        }
+    else:
+        fault_details = {
+            'fault_file_name': step.fault_file_name,
+            'fault_file_folder': step.fault_file_folder,
+            'executable': step.executable,
+        }
+        fault_arguments = {
+            'executable_arguments': step.executable_arguments,
+            'fault_script_arguments': step.fault_script_arguments,
+        }
+    return fault_details, fault_arguments
+
+
 def _parse_fault(fault_details, fault_time, service_name):
     possibilities = {
         "kill": KillFault,
@@ -541,74 +818,69 @@ def _parse_fault(fault_details, fault_time, service_name):
     raise ValueError(fault_details, "Fault not supported, possibilities: " + str(possibilities.keys()))
 
 
-def _parse_real(name, spec):
-    msg = "Currently we do not support Real format TODO FIXME"
-    log.error(msg)
-    raise ValueError(msg)
-    import sqlite3
+def _load_trace(spec):
+    """Loads an availability trace, as a DataFrame with the event_trace
+    columns: node_id, event_start_time and event_type (1 = up, 0 = down).
+    """
+    import pandas
 
-    database = spec.get('database')
-    if not database:
-        raise ValueError("Real churn spec must have database")
-
-    time_factor = spec.get('time_factor', 1)
-    time_step = spec.get('time_step', 10)
-    max_duration = spec.get('max_duration')
-    signal = spec.get('signal')
+    columns = ['node_id', 'event_start_time', 'event_type']
+    if spec.get('database'):
+        import sqlite3
+        with sqlite3.connect(spec['database']) as sql:
+            return pandas.read_sql_query("SELECT node_id, event_start_time, event_type "
+                                         "FROM event_trace", sql)
+    elif spec.get('csv'):
+        return pandas.read_csv(spec['csv'], usecols=columns)
+    raise ValueError("Real churn spec must have database or csv")
 
-    sql = sqlite3.connect(database)
-    cur = sql.cursor()
-    # HUGE performance boost
-    cur.execute(r"CREATE INDEX IF NOT EXISTS start_time_index "
-                "ON event_trace (event_start_time)")
-    cur.fetchone()
 
-    cur.execute(r"SELECT MIN(event_start_time), MAX(event_start_time) "
-                "FROM event_trace")
-    min_time, max_time = map(int, cur.fetchone())
+def _parse_real(spec, start_replicas):
+    """Replays an availability trace as moments of the service `spec['service']`.
 
-    cur.execute("""
-    SELECT DISTINCT node_id FROM event_trace
-    WHERE event_start_time <= ?
-    ORDER BY node_id""",
-                [max_time])
+    Trace time is compressed by `time_factor` and split into windows of
+    `time_step` (experiment) seconds. In each window, nodes with more ups
+    than downs become started replicas, and nodes with more downs than ups
+    stopped replicas. Returns the moments, in the same format as the churn
+    specification, so they can be sent to the slaves.
+    """
+    import pandas
 
-    node_ids = [x[0] for x in cur.fetchall()]
-    nodes = dict(zip(node_ids, range(len(node_ids))))
+    service_name = spec.get('service')
+    if not service_name:
+        raise ValueError("Real churn spec must have service")
 
-    end_time = (max_time - min_time) / time_factor / time_step
-    end_time = int(end_time + 1) * time_step
-    end_time = min(end_time, max_duration)
+    time_factor = spec.get('time_factor', 1)
+    time_step = spec.get('time_step', 10)
+    max_duration = spec.get('max_duration')
 
-    service = {'start': 0, 'end': end_time, 'steps': []}
+    trace = _load_trace(spec)
+    if trace.empty:
+        return []
 
     step = time_step * time_factor
-    for i, t in enumerate(range(min_time, max_time+step+1, step)):
-        time = (i+1) * time_step
-        if max_duration and time > max_duration:
+    window = (trace.event_start_time - trace.event_start_time.min()) // step
+    # ups - downs of each node in each window
+    net = ((trace.event_type == 1).astype(int) * 2 - 1).groupby([window, trace.node_id]).sum()
+    windows = pandas.DataFrame({'add': net > 0, 'kill': net < 0}).groupby(level=0).sum()
+
+    moments = []
+    current = start_replicas
+    for w, add, kill in windows.itertuples():
+        moment_time = (int(w) + 1) * time_step
+        if max_duration and moment_time > max_duration:
             break
 
-        cur.execute("""
-        SELECT node_id, event_type FROM event_trace
-        WHERE event_start_time >= ?
-        AND event_start_time < ?
-        ORDER BY node_id, event_start_time""",
-                    (t, t+step))
-
-        events = cur.fetchall()
-        kill, add = [], []
-        for node in {x[0] for x in events}:
-            ups = sum(1 for x in events if x[0] == node and x[1] == 1)
-            downs = sum(1 for x in events if x[0] == node and x[1] == 0)
-
-            if ups > downs:
-                add.append(nodes[node])
-            if downs > ups:
-                kill.append(nodes[node])
-
+        # can't stop replicas the trace didn't start
+        kill = min(int(kill), current)
+        current += int(add) - kill
+        events = []
         if kill:
-            service['steps'].append((time, name, 'kill', kill, signal))
+            events.append({'stop': {'amount': kill}})
         if add:
-            service['steps'].append((time, name, 'add', add, None))
+            events.append({'start': {'amount': int(add)}})
+        if events:
+            moments.append({'moment': {'time': moment_time, 'services': {service_name: events}}})
 
-    return service
+    log.debug("Real churn: %d trace events replayed as %d moments", len(trace), len(moments))
+    return moments
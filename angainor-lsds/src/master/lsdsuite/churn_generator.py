@@ -0,0 +1,100 @@
+import heapq
+import logging
+import random
+
+log = logging.getLogger(__name__)
+
+
+def _exponential_session(spec):
+    mean = float(spec.get('mean', 60))
+    if mean <= 0:
+        raise ValueError("session mean must be > 0")
+    return lambda rng: rng.expovariate(1 / mean)
+
+
+def _weibull_session(spec):
+    shape = float(spec.get('shape', 1))
+    scale = float(spec.get('scale', 60))
+    if shape <= 0 or scale <= 0:
+        raise ValueError("session shape and scale must be > 0")
+    return lambda rng: rng.weibullvariate(scale, shape)
+
+
+# session length distribution of each model
+MODELS = {
+    'poisson': _exponential_session,
+    'weibull': _weibull_session,
+}
+
+
+def generate_moments(spec, seed, end=None):
+    """Yields the moments of a `generate` churn step, in time order.
+
+    Replicas of `spec['service']` arrive as a Poisson process of `rate`
+    replicas per second between `start` and `end`, and each one stays for a
+    session drawn from the model: exponential with mean `session.mean`
+    (poisson), or Weibull with `session.shape` and `session.scale`
+    (weibull). Arrivals and departures are grouped in moments every
+    `time_step` seconds, starts before stops. Moments are generated one at a
+    time and the same `seed` always yields the same moments.
+    """
+    service_name = spec.get('service')
+    if not service_name:
+        raise ValueError("generate must have service")
+
+    model = spec.get('model', 'poisson')
+    if model not in MODELS:
+        raise ValueError("Unsupported model: {}, possibilities: {}".format(model, list(MODELS)))
+    session = MODELS[model](spec.get('session') or {})
+
+    rate = float(spec.get('rate', 0))
+    if rate <= 0:
+        raise ValueError("generate rate must be > 0")
+
+    time_step = int(spec.get('time_step', 1))
+    if time_step < 1:
+        raise ValueError("generate time_step must be >= 1")
+    start = float(spec.get('start', 0))
+    end = float(spec.get('end', end if end is not None else 0))
+    if end <= start:
+        raise ValueError("generate end must be after start")
+
+    rng = random.Random(spec.get('seed', seed))
+
+    def moment_time(t):
+        # moments happen at the end of their time step, and never at 0
+        return (int(t // time_step) + 1) * time_step
+
+    departures = []  # heap of departure times of the replicas alive
+    arrival = start + rng.expovariate(rate)
+    while True:
+        # next time step with an arrival or a departure
+        pending = []
+        if arrival < end:
+            pending.append(moment_time(arrival))
+        if departures and departures[0] < end:
+            pending.append(moment_time(departures[0]))
+        if not pending:
+            return
+        current = min(pending)
+
+        starts = 0
+        while arrival < end and moment_time(arrival) == current:
+            starts += 1
+            heapq.heappush(departures, arrival + session(rng))
+            arrival += rng.expovariate(rate)
+
+        stops = 0
+        while departures and departures[0] < end and moment_time(departures[0]) <= current:
+            heapq.heappop(departures)
+            stops += 1
+
+        if current >= end:
+            # last time step is cut at end
+            current = int(end)
+        events = []
+        if starts:
+            events.append({'start': {'amount': starts}})
+        if stops:
+            events.append({'stop': {'amount': stops}})
+        yield {'moment': {'time': current, 'services': {service_name: events}}}
@@ -0,0 +1,171 @@
+import json
+import logging
+import random
+
+from .experiment_step import BeginningStep, EndStep, MarkStep, StartReplicasStep, \
+    StopReplicasStep, KillFault, SignalStep, CustomFaultStep, CPUFault, \
+    DEFAULT_FILE_FOLDER, DEFAULT_EXECUTABLE
+
+log = logging.getLogger(__name__)
+
+# seed used by the slaves when the churn doesn't specify one
+DEFAULT_SEED = 789
+
+
+class ServiceSlots(object):
+    """Slots of the containers of a service, alive and dead.
+
+    Slots start at 0, new containers always get a slot above every slot used
+    before, like the slaves' replica holders.
+    """
+
+    def __init__(self, n):
+        self.alive = []
+        self.dead = []
+        self.next = 0
+        # containers killed at slots only known when the step runs
+        self.lost = 0
+        self.born(n)
+
+    def born(self, n):
+        self.alive += range(self.next, self.next + n)
+        self.next += n
+
+    def kill(self, slots):
+        for slot in slots:
+            self.alive.remove(slot)
+            self.dead.append(slot)
+
+    def lose(self, n):
+        if n > len(self.alive) - self.lost:
+            raise ValueError("There are not enough containers alive as requested. Alive {}, Requested: {}"
+                             .format(len(self.alive) - self.lost, n))
+        self.lost += n
+
+    def pick(self, n, rng):
+        if n > len(self.alive) - self.lost:
+            raise ValueError("There are not enough containers alive as requested. Alive {}, Requested: {}"
+                             .format(len(self.alive) - self.lost, n))
+        return rng.sample(sorted(self.alive), n)
+
+    def check_alive(self, slots):
+        slots = list(slots)
+        for slot in slots:
+            if slot not in self.alive:
+                raise ValueError("Slot {} is not alive".format(slot))
+        return slots
+
+
+def compile_plan(timeline, start_replicas, seed=None, default_policy=None):
+    """Compiles a churn timeline, with amounts and ids already processed,
+    into the plan executed by the slaves.
+
+    The slots of every container action are picked here (at random, from
+    `seed`) and saved in the `slots` attribute of the step, so the slaves
+    don't need to parse the churn nor follow the replicas of each service.
+    Injectors (what is done to the containers) are listed once and referred
+    to by index.
+
+    When the master injects the faults, `default_policy` is the victim
+    policy of the targets without one. Steps with a policy other than
+    `specific` get their victims chosen by the master when they run: their
+    `slots` is None and they have no container actions. The slots they kill
+    are not known here, so the slots of later steps of the same service
+    that are not chosen by the master may have been killed already.
+    """
+    rng = random.Random(DEFAULT_SEED if seed is None else seed)
+    services = {name: ServiceSlots(n) for name, n in start_replicas.items()}
+    injectors = []
+    injector_index = {}
+    actions = []
+
+    def injector(details):
+        key = json.dumps(details, sort_keys=True)
+        if key not in injector_index:
+            injector_index[key] = len(injectors)
+            injectors.append(details)
+        return injector_index[key]
+
+    for step in timeline:
+        action = {'t': step.time, 'i': step.get_id()}
+        if isinstance(step, EndStep):
+            actions.append(dict(action, k='end'))
+        elif isinstance(step, MarkStep):
+            actions.append(dict(action, k='mark', m=step.message))
+        elif isinstance(step, BeginningStep):
+            actions.append(dict(action, k='beginning'))
+        elif isinstance(step, StartReplicasStep):
+            slots = services[step.service_name]
+            slots.born(step.number_replicas)
+            actions.append(dict(action, k='start', s=step.service_name, n=step.number_replicas))
+        else:
+            try:
+                details, kills = _container_injector(step)
+                if _master_chosen(step, default_policy):
+                    step.slots = None
+                    if kills:
+                        services[step.service_name].lose(step.number_replicas)
+                    continue
+                step.slots = _target_slots(step, services[step.service_name], rng)
+            except (KeyError, ValueError) as e:
+                raise ValueError("Compiling churn step {}: {!r}".format(step, e))
+            if kills:
+                services[step.service_name].kill(step.slots)
+            j = injector(details)
+            for offset, slot in enumerate(step.slots):
+                actions.append({'t': step.time, 'i': step.get_id() + offset, 'k': 'container',
+                                's': step.service_name, 'n': slot, 'j': j})
+
+    return {'injectors': injectors, 'actions': actions}
+
+
+def _master_chosen(step, default_policy):
+    """Whether the master picks the victims of `step` when it runs."""
+    from .engine.victims import POLICIES
+
+    policy = step.target_details.get('policy')
+    if policy is not None and policy not in POLICIES:
+        raise ValueError("Unsupported victim policy: {}, possibilities: {}".format(policy, list(POLICIES)))
+    if default_policy is None:
+        # the slaves inject the faults, at the slots of the plan
+        return False
+    if policy is None and step.target_details.get('specific') is not None:
+        policy = 'specific'
+    return (policy or default_policy) != 'specific'
+
+
+def _target_slots(step, slots, rng):
+    specific = step.target_details.get('specific')
+    if specific is not None:
+        return slots.check_alive(int(slot) for slot in specific)
+    return slots.pick(step.number_replicas, rng)
+
+
+def _fault_details(file_name, folder=DEFAULT_FILE_FOLDER, executable=DEFAULT_EXECUTABLE,
+                   executable_arguments=(), script_arguments=()):
+    return {'fault': {
+        'FaultScriptFileName': file_name,
+        'FaultScriptFolder': folder,
+        'Executable': executable,
+        'ExecutableArguments': list(executable_arguments),
+        'FaultScriptArguments': list(script_arguments),
+    }}
+
+
+def _container_injector(step):
+    """Returns the injector of a step and whether it kills the containers."""
+    if isinstance(step, StopReplicasStep):
+        return {'stop': True}, True
+    if isinstance(step, KillFault):
+        return {'signal': 'SIGKILL'}, True
+    if isinstance(step, SignalStep):
+        return {'signal': step.signal.upper()}, step.kills_container
+    if isinstance(step, CustomFaultStep):
+        return _fault_details(step.fault_file_name, step.fault_file_folder, step.executable,
+                              step.executable_arguments, step.fault_script_arguments), \
+            step.kills_container
+    if isinstance(step, CPUFault):
+        if not step.duration or int(step.duration) <= 0:
+            raise ValueError("CPU duration must be set and bigger than 0")
+        return _fault_details("waste_cpu", script_arguments=[str(step.duration)]), False
+    raise ValueError("Unsupported step: {}".format(step))
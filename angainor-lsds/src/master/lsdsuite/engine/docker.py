@@ -1,4 +1,5 @@
 import re
+import asyncio
 import logging
 import time
 import threading
@@ -8,8 +9,8 @@ import docker
 from docker import types
 from docker.errors import APIError
 
-from lsdsuite.ThreadWithReturnValue.ThreadWithReturnValue import ThreadWithReturn
 from .. import get_config, get_ssh, get_scp
+from .state import ClusterState
 
 log = logging.getLogger(__name__)
 
@@ -21,6 +22,23 @@ PORT_REGEX = re.compile(r"^(\d+)(?::(\d+))?(?:/(udp|tcp))?$")
 # Was previously a field in config.yaml, but was removed since it never changes
 DOCKER_SOCK = "/var/run/docker.sock"
 
+# Seconds to wait for the slaves to pull an image
+PULL_TIMEOUT = 30 * 60
+
+# Seconds to wait for Docker to register a change of a service's replicas
+REGISTER_TIMEOUT = 5
+
+# Seconds to wait for the containers of a removed service to be gone
+REMOVE_TIMEOUT = 60
+
+# Seconds to wait for all slaves to answer after starting them, and between
+# two attempts
+SLAVE_START_TIMEOUT = 60
+SLAVE_POLL_INTERVAL = 1
+
+# SSH connections opened at once to check that nodes are reachable
+SSH_CHECK_WORKERS = 64
+
 
 class Engine(object):
     def __init__(self, config=None, client=None):
@@ -45,6 +63,22 @@ class Engine(object):
         self.slave_port = config['slave_port']
         self.ipam_port = config['ipam_port']
 
+        # Keep-alive connections to the slaves, by node ip
+        self._slave_pools = {}
+        self._slave_pools_lock = threading.Lock()
+        # Event loop of the asynchronous slave commands, see run_coroutine
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+        # Node list used by fan-out commands, see cached_nodes
+        self._nodes = None
+        self._nodes_by_id = {}
+        self._nodes_time = 0
+        self._nodes_lock = threading.Lock()
+
+        # {address: (monotonic time, reachable)}, see _ssh_reachable
+        self._ssh_checks = {}
+
         if not client:
             client = docker.APIClient(version='auto')
         elif type(client) is docker.client.DockerClient:
@@ -53,6 +87,8 @@ class Engine(object):
 
         # Resource cache
         self._cache = {cls: dict() for cls in [Node, Network, Service, Task]}
+        # Tasks of the cluster, kept up to date by a single watcher thread
+        self.state = ClusterState(self, max_age=config['task_cache_ttl'])
 
         # Getter methods for a single resource
         self._get = {
@@ -70,6 +106,33 @@ class Engine(object):
             Task: client.tasks
         }
 
+    def slave_pool(self, ip):
+        """Returns the connection pool to the slave running on node `ip`."""
+        from .slave_connection import SlavePool
+
+        with self._slave_pools_lock:
+            pool = self._slave_pools.get(ip)
+            if pool is None:
+                pool = SlavePool((ip, self.slave_port),
+                                 size=self.config['slave_pool_size'],
+                                 timeout=self.config['slave_timeout'])
+                self._slave_pools[ip] = pool
+            return pool
+
+    def run_coroutine(self, coroutine):
+        """Runs `coroutine` on the engine's event loop and returns its result.
+
+        The loop runs in a thread of its own for the whole life of the
+        engine, so that the connections opened to the slaves by
+        SlavePool.async_pipeline stay open from one call to the next.
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="slave-io",
+                                 daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
     def list(self, cls, filters=None):
         data = self._list[cls](filters=filters)
         return [self._update_cache(cls, d) for d in data]
@@ -80,11 +143,42 @@ class Engine(object):
 
     def nodes(self, **filters):
         # TODO: filter out nodes that aren't ready?
-        return self.list(Node, filters)
+        nodes = self.list(Node, filters)
+        if not filters:
+            with self._nodes_lock:
+                self._nodes, self._nodes_time = nodes, time.monotonic()
+                self._nodes_by_id = {node.id: node for node in nodes}
+        return nodes
+
+    def cached_nodes(self, max_age=None):
+        """Returns the nodes of the cluster, listed at most `max_age` seconds
+        ago (`node_cache_ttl` by default).
+
+        Used by fan-out commands: they are sent often and the nodes of the
+        cluster rarely change during a benchmark.
+        """
+        if max_age is None:
+            max_age = self.config['node_cache_ttl']
+
+        with self._nodes_lock:
+            if self._nodes is not None and time.monotonic() - self._nodes_time <= max_age:
+                return self._nodes
+        return self.nodes()
 
     def node(self, id):
         return self.get(Node, id)
 
+    def cached_node(self, id):
+        """Returns node `id` from the node list of `cached_nodes`, only
+        inspecting nodes that aren't in it.
+        """
+        self.cached_nodes()
+        with self._nodes_lock:
+            node = self._nodes_by_id.get(id)
+        if node is None:
+            node = self.node(id)
+        return node
+
     def networks(self, **filters):
         return self.list(Network, filters)
 
@@ -117,37 +211,66 @@ class Engine(object):
     def send_command(self, command, **params):
         return [node.send_command(command, **params) for node in self.nodes()]
 
-    def parallel_send(self, command, **params):
-        threads = []
-        for node in self.nodes():
-            t = ThreadWithReturn(target=node.send,
-                                 args=(command,),
-                                 kwargs=params,
-                                 name=str(node))
-            log.debug("Starting thread %s...", node)
-            t.start()
-            threads.append(t)
-        results = []
-        for t in threads:
-            log.debug("Waiting for thread %s...", t.name)
-            results.append(t.join())
-        return results
+    def parallel_send(self, command, timeout=None, **params):
+        return [status == 'ok' for status, msg in
+                self.parallel_send_command(command, timeout, **params)]
 
-    def parallel_send_command(self, command, **params):
-        threads = []
-        for node in self.nodes():
-            t = ThreadWithReturn(target=node.send_command,
-                                 args=(command,),
-                                 kwargs=params,
-                                 name=str(node))
-            log.debug("Starting thread %s...", node)
-            t.start()
-            threads.append(t)
-        results = []
-        for t in threads:
-            log.debug("Waiting for thread %s...", t.name)
-            results.append(t.join())
-        return results
+    def parallel_send_command(self, command, timeout=None, **params):
+        return self.run_coroutine(self.async_send_command(command, timeout=timeout, **params))
+
+    async def async_send_command(self, command, nodes=None, timeout=None,
+                                 mapArrayStringParams={}, **params):
+        """Sends a command to the slaves of `nodes` (all nodes by default),
+        concurrently. Must run on the engine's event loop (see run_coroutine).
+
+        Returns the slave answer status and status message of each node, in
+        order. A node that fails or doesn't answer within `timeout` seconds
+        (`slave_timeout` by default) is answered ('err', reason), the answers
+        of the other nodes are still returned.
+        """
+        answers = await self.async_send_commands([(command, mapArrayStringParams, params)],
+                                                 nodes, timeout)
+        return [node_answers[0] for node_answers in answers]
+
+    async def async_send_commands(self, commands, nodes=None, timeout=None):
+        """Same as `async_send_command`, for several commands.
+
+        commands is a list of (command, mapArrayStringParams, params) tuples,
+        sent to each slave on the same connection without waiting for each
+        answer. Returns the list of answers of each node.
+        """
+        if nodes is None:
+            nodes = self.cached_nodes()
+        return await self.async_send_node_commands([(node, commands) for node in nodes], timeout)
+
+    def send_node_commands(self, node_commands, timeout=None):
+        return self.run_coroutine(self.async_send_node_commands(node_commands, timeout))
+
+    async def async_send_node_commands(self, node_commands, timeout=None):
+        """Sends each node its own commands, concurrently.
+
+        node_commands is a list of (node, commands) pairs, commands being a
+        list of (command, mapArrayStringParams, params) tuples pipelined on a
+        connection to the node. Returns the list of answers of each node.
+        """
+        async def send(node, commands):
+            msgs = [{'command': command, 'MapStringParams': params,
+                     'MapArrayStringParams': mapArrayStringParams}
+                    for command, mapArrayStringParams, params in commands]
+            names = ", ".join(command for command, _, _ in commands)
+            log.debug("Send [%s] %s", node.ip, msgs)
+            try:
+                responses = await self.slave_pool(node.ip).async_pipeline(msgs, timeout)
+            except asyncio.TimeoutError:
+                log.warning("%s: no answer to %s", node, names)
+                return [('err', 'timeout')] * len(msgs)
+            except (OSError, ValueError) as e:
+                log.warning("%s: %s failed: %s", node, names, e)
+                return [('err', str(e))] * len(msgs)
+            log.debug("Response [%s] %s", node.ip, responses)
+            return [(resp.get('status'), resp.get('msg', None)) for resp in responses]
+
+        return list(await asyncio.gather(*[send(node, commands) for node, commands in node_commands]))
 
     def prune(self):
         log.info("Cleanup:")
@@ -237,14 +360,17 @@ class Engine(object):
     def get_processed_events(self):
         import json
         nodes = self.nodes()
+        answers = self.run_coroutine(self.async_send_command("processed_moments", nodes))
 
         max_id = 0
         ids_processor = {}
         hosts = []
-        for node in nodes:
+        for node, (status, result) in zip(nodes, answers):
             hostname = node.hostname
             hosts += [hostname]
-            status, result = node.send_command("processed_moments")
+            if status != 'ok':
+                log.warning("Could not get processed events of %s: %s", node, result)
+                continue
 
             events = json.loads(result)
             for event in events:
@@ -263,31 +389,39 @@ class Engine(object):
         return ids_processor, max_id, hosts
     # remote_path is whete the faults folder is located in each node
     def cluster_status(self, container_path):
+        """Status of every node of the config, probed concurrently: SSH
+        reachability (cached `ssh_cache_ttl` seconds), Swarm membership and
+        slave answers.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
         if not self._cluster_is_init():
             return None
 
         config_nodes = self.config['nodes']
         manager = config_nodes[0]
         swarm_nodes = {n.ip: n for n in self.nodes()}
+        probed = [swarm_nodes[node['address']] for node in config_nodes
+                  if node['address'] in swarm_nodes]
+
+        with ThreadPoolExecutor(max_workers=SSH_CHECK_WORKERS) as executor:
+            ssh = [executor.submit(self._ssh_reachable, node)
+                   if node is not manager or node.get('remote') else None
+                   for node in config_nodes]
+            probes = dict(zip([n.ip for n in probed],
+                              self.run_coroutine(self.async_probe(probed, container_path))))
 
         status = []
-        for node in config_nodes:
+        for node, ssh_ok in zip(config_nodes, ssh):
             ok = True
             s = {k: None for k in
                  ['address', 'hostname', 'ssh', 'swarm', 'ready', 'slave', 'slave:version', 'slave:faults', 'ntp']}
 
             ip = s['address'] = node['address']
 
-            if node is manager and not node.get('remote'):
-                s['ssh'] = True
-            else:
-                try:
-                    with get_ssh(node):
-                        s['ssh'] = True
-                except Exception as e:
-                    # TODO: catch more specific exception
-                    log.warning("Can't reach %s: %s", ip, e)
-                    ok = s['ssh'] = False
+            s['ssh'] = True if ssh_ok is None else ssh_ok.result()
+            if not s['ssh']:
+                ok = False
 
             n = swarm_nodes.get(ip)
             if n is None:
@@ -299,21 +433,75 @@ class Engine(object):
                     s['ready'] = True
                 else:
                     ok = s['ready'] = False
-                try:
-                    s['slave'] = n.status
-                    s['slave:version'] = n.slave_version
-                    s['slave:faults'] = n.faults_hash(container_path)
-                    s['ntp'] = n.ntp_offset
-                except Exception as e:
-                    # TODO: catch more specific exception
-                    log.warning("Can't reach %s: %s", ip, e)
-                    ok = s['slave'] = False
+                s.update(probes[ip])
+                if not s['slave']:
+                    ok = False
 
             s['ok'] = ok
             status.append(s)
 
         return status
 
+    def _ssh_reachable(self, node):
+        """Whether `node` accepts SSH connections, checked at most every
+        `ssh_cache_ttl` seconds.
+        """
+        address = node['address']
+        checked = self._ssh_checks.get(address)
+        if checked is not None and time.monotonic() - checked[0] < self.config['ssh_cache_ttl']:
+            return checked[1]
+
+        try:
+            with get_ssh(node):
+                reachable = True
+        except Exception as e:
+            # TODO: catch more specific exception
+            log.warning("Can't reach %s: %s", address, e)
+            reachable = False
+        self._ssh_checks[address] = (time.monotonic(), reachable)
+        return reachable
+
+    async def async_probe(self, nodes, container_path):
+        """Asks the slaves of `nodes` their status, version, hash of the
+        faults folder and NTP offset, with one `probe` command.
+
+        Slaves that don't know `probe` get the four commands, pipelined on
+        one connection. Returns the cluster_status fields of each node.
+        """
+        import json
+
+        answers = await self.async_send_command('probe', nodes, path=container_path)
+
+        legacy = [node for node, (status, msg) in zip(nodes, answers)
+                  if status != 'ok' and 'unknown command' in str(msg)]
+        legacy_answers = dict(zip([node.ip for node in legacy], await self.async_send_commands(
+            [('status', {}, {}), ('slave_version', {}, {}),
+             ('faults_hash', {}, {'path': container_path}), ('ntp_offset', {}, {})],
+            legacy)))
+
+        probes = []
+        for node, (status, msg) in zip(nodes, answers):
+            if node.ip in legacy_answers:
+                (status, _), version, faults, ntp = legacy_answers[node.ip]
+                probes.append({
+                    'slave': status == 'ok',
+                    'slave:version': version[1] if version[0] == 'ok' else "Failed To Get Version",
+                    'slave:faults': faults[1] if faults[0] == 'ok' else "Failed To Get Hash",
+                    'ntp': ntp[1] if ntp[0] == 'ok' else "Failed to Get NTP Offset",
+                })
+            elif status != 'ok':
+                log.warning("Can't reach %s: %s", node.ip, msg)
+                probes.append({'slave': False})
+            else:
+                probe = json.loads(msg)
+                probes.append({
+                    'slave': True,
+                    'slave:version': probe.get('version'),
+                    'slave:faults': probe.get('faults_hash', "Failed To Get Hash"),
+                    'ntp': probe.get('ntp_offset', "Failed to Get NTP Offset"),
+                })
+        return probes
+
     def cluster_init(self, force=False):
         from os import makedirs
 
@@ -388,8 +576,8 @@ class Engine(object):
         log.info("Start Slave Service")
         self.start_slave(faults_folder_in_host, faults_folder_in_container, restart=True)
         self.services(name='lsdsuite-slave')[0].wait()
-        log.info("Waiting 10 seconds for slaves to come up")
-        time.sleep(10)
+        log.info("Waiting for slaves to come up")
+        self.wait_slaves()
         log.info("Starting IPAM Service (network related)")
         self.start_ipam(restart=True)
         self.services(name='lsdsuite-ipam')[0].wait()
@@ -422,7 +610,8 @@ class Engine(object):
         # capabilities in docker swarm only comes out in version 19.06 of Docker,
         # so we will "manually" launch a container on each slave
         log.info("Synchronizing Clocks")
-        results = self.parallel_send("ntp_sync", **{"docker_image": self.ntp_sync_image})
+        # the slaves may have to pull the image first
+        results = self.parallel_send("ntp_sync", PULL_TIMEOUT, **{"docker_image": self.ntp_sync_image})
         if not all(results):
             log.warning("There was an error syncing NTP (IGNORING it). check slave logs for details.")
 
@@ -432,7 +621,7 @@ class Engine(object):
         if service:
             if restart:
                 service.remove()
-                time.sleep(10)
+                service.wait_removed(REMOVE_TIMEOUT)
             else:
                 return service
 
@@ -480,6 +669,28 @@ class Engine(object):
         service = self.service(service['ID'])
         return service
 
+    def wait_slaves(self, timeout=SLAVE_START_TIMEOUT):
+        """Waits until the slave of every ready node answers `status`.
+
+        Returns False if some slaves still don't answer after `timeout`
+        seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            nodes = [node for node in self.nodes() if node.ready]
+            answers = self.run_coroutine(self.async_send_command('status', nodes=nodes,
+                                                                 timeout=SLAVE_POLL_INTERVAL))
+            up = sum(status == 'ok' for status, _ in answers)
+            if up == len(nodes):
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                log.warning("Only %d/%d slaves answer after %ds", up, len(nodes), timeout)
+                return False
+            log.debug("%d/%d slaves answer", up, len(nodes))
+            time.sleep(min(SLAVE_POLL_INTERVAL, remaining))
+
     def stop_slave(self):
         """Stops lsdsuite-slave service."""
         service, = self.services(name='lsdsuite-slave') or [None]
@@ -492,7 +703,7 @@ class Engine(object):
         if service:
             if restart:
                 service.remove()
-                time.sleep(10)
+                service.wait_removed(REMOVE_TIMEOUT)
             else:
                 return service
 
@@ -532,7 +743,7 @@ class Engine(object):
         if service:
             if restart:
                 service.remove()
-                time.sleep(10)
+                service.wait_removed(REMOVE_TIMEOUT)
             else:
                 return service
 
@@ -572,6 +783,11 @@ class Engine(object):
 
         return service
 
+    async def _pull_images(self, images):
+        return await asyncio.gather(*[
+            self.async_send_command('pull', timeout=PULL_TIMEOUT, image=image)
+            for image in images])
+
     def create_app(self, name, spec):
         """Creates App from spec.
 
@@ -582,45 +798,71 @@ class Engine(object):
 
         log.info('Creating %s...', app)
         # Pull images before creating services
-        # only pull images one time
-        pulled_images = {}
+        # only pull images one time, all of them at the same time
+        images = []
         for service in spec['services']:
             image = spec['services'][service].get('image')
             if not image:
                 msg = "Service {}: no image specified".format(service)
                 log.error(msg)
                 raise ValueError(msg)
-
-            log.debug('Pulling image %s...', image)
-            if not pulled_images.get(image, False):
-                # TODO: check return value
-                answers = self.parallel_send('pull', image=image)
-                print("Pull answers: ", answers)
-                pulled_images[image] = True
-                for answer in answers:
-                    if answer == False:
-                        raise ValueError("Failed to pull image: " + str(image))
-
+            if image not in images:
+                images.append(image)
+
+        timings = {}
+        start = time.monotonic()
+        log.debug('Pulling images %s...', images)
+        answers = self.run_coroutine(self._pull_images(images))
+        for image, image_answers in zip(images, answers):
+            for status, msg in image_answers:
+                if status != 'ok':
+                    raise ValueError("Failed to pull image: " + str(image) + ": " + str(msg))
+        timings['pull'] = time.monotonic() - start
+
+        for service, service_spec in spec['services'].items():
+            service_spec['labels'] = service_spec.get('labels') or {}
+            service_spec['labels'].update(**{
+                'org.faultsee.experiment.container': "true",
+            })
+
+        # networks first, services refer to them by name
         try:
-            for network in spec.get('networks', {}):
-                log.debug('Creating network %s...', network)
-                self.create_network(app, network, spec)
-
-            for service, service_spec in spec['services'].items():
-                log.debug('Creating service %s...', service)
-                service_spec['labels'] = service_spec.get('labels') or {}
-                service_spec['labels'].update(**{
-                    'org.faultsee.experiment.container': "true",
-                })
-                self.create_service(app, service, spec)
+            start = time.monotonic()
+            log.debug('Creating networks %s...', list(spec.get('networks', {})))
+            self._create_concurrently(self.create_network, app, spec.get('networks', {}), spec)
+            timings['networks'] = time.monotonic() - start
+
+            start = time.monotonic()
+            log.debug('Creating services %s...', list(spec['services']))
+            self._create_concurrently(self.create_service, app, spec['services'], spec)
+            timings['services'] = time.monotonic() - start
 
         except APIError as e:
             app.remove()
             raise e
 
-        log.info("%s created", app)
+        app.timings = timings
+        log.info("%s created (%s)", app,
+                 ", ".join("{} {:.1f}s".format(phase, t) for phase, t in timings.items()))
         return app
 
+    def _create_concurrently(self, create, app, names, spec):
+        """Calls `create(app, name, spec)` for all names, at most
+        `create_workers` at a time, and raises the first error once all
+        calls are done.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=self.config['create_workers']) as executor:
+            futures = [executor.submit(create, app, name, spec) for name in names]
+
+        for name, future in zip(names, futures):
+            error = future.exception()
+            if error is not None:
+                log.error("Creating %s failed: %s", name, error)
+        for future in futures:
+            future.result()
+
     def create_network(self, app, name, spec):
         args = self._spec_to_network(name, spec)
 
@@ -921,6 +1163,8 @@ class App(object):
 
         self.engine = engine
         self.name = name
+        # seconds spent in each phase of Engine.create_app
+        self.timings = {}
         self.label_selector = "org.lsdsuite.app.id={}".format(self.id)
 
     # def send_start_to_all_nodes(self):
@@ -929,15 +1173,29 @@ class App(object):
     def send_dry_run_to_all_nodes(self):
         self.engine.send("start_dry_run")
 
-    def remove(self):
+    def remove(self, wait=None):
+        """Removes the services and networks of the app.
+
+        With `wait`, networks are only removed once the containers of all
+        services are gone, or `wait` seconds went by. Returns whether the
+        containers are gone.
+        """
         log.info('Removing %s...', self)
-        for service in self.services:
+        services = self.services
+        for service in services:
             service.remove()
 
+        gone = True
+        if wait:
+            deadline = time.monotonic() + wait
+            for service in services:
+                gone = service.wait_removed(max(0, deadline - time.monotonic())) and gone
+
         for network in self.networks:
             network.remove()
 
         log.info('%s removed', self)
+        return gone
 
     @property
     def networks(self):
@@ -1018,29 +1276,23 @@ class Node(Resource):
 
         Returns he slave answer status and status message
         """
-        import json
-        import socket
-        msg = json.dumps({'command': command, 'MapStringParams': params,
-                          'MapArrayStringParams': mapArrayStringParams})
-        log.debug("Send [%s] %s", self.ip, msg)
-
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            # TODO: catch "Connection refused" ?
-            sock.connect((self.ip, self.engine.slave_port))
-            sock.send(msg.encode())
-
-            resp = b''
-            while True:
-                r = sock.recv(2 ** 10)
-                if r:
-                    resp += r
-                else:
-                    break
+        return self.send_commands([(command, mapArrayStringParams, params)])[0]
+
+    def send_commands(self, commands):
+        """Sends several commands to the lsdsuite-slave instance running on node.
+        commands is a list of (command, mapArrayStringParams, params) tuples,
+        sent on the same connection without waiting for each answer.
+
+        Returns the slave answer status and status message of each command
+        """
+        msgs = [{'command': command, 'MapStringParams': params,
+                 'MapArrayStringParams': mapArrayStringParams}
+                for command, mapArrayStringParams, params in commands]
+        log.debug("Send [%s] %s", self.ip, msgs)
 
-            resp = resp.decode()
-            log.debug("Response [%s] %s", self.ip, resp.strip())
-            resp = json.loads(resp)
-            return resp.get('status'), resp.get('msg', None)
+        responses = self.engine.slave_pool(self.ip).pipeline(msgs)
+        log.debug("Response [%s] %s", self.ip, responses)
+        return [(resp.get('status'), resp.get('msg', None)) for resp in responses]
 
     @property
     def state(self):
@@ -1080,6 +1332,10 @@ class Node(Resource):
     def hostname(self):
         return self['Description']['Hostname']
 
+    @property
+    def labels(self):
+        return self['Spec'].get('Labels') or {}
+
     @property
     def role(self):
         return self['Spec']['Role']
@@ -1118,7 +1374,7 @@ class Service(Resource):
 
     @property
     def tasks(self):
-        return self.engine.tasks(service=self.id)
+        return self.engine.state.tasks(self.id)
 
     @property
     def live_tasks(self):
@@ -1181,34 +1437,44 @@ class Service(Resource):
     def add(self, n, wait=True):
         """Adds `n` replicas and optionally waits for them to start."""
         log.debug("%s: add %d replicas", self, n)
-        old_tasks = set(self.tasks)
+        old_tasks = set(self.engine.state.tasks(self.id, max_age=0))
 
         self.desired_replicas += n
-        time.sleep(5)  # wait for Docker to register change
-        if wait:
-            self.wait()
+        new_tasks = self._scaled(wait)
 
-        new_tasks = set(self.tasks)
-
-        return list(new_tasks - old_tasks)
+        return list(set(new_tasks) - old_tasks)
 
     def rm(self, n, signal="TERM", wait=True):
         """Removes `n` replicas and optionally waits for them to start."""
         log.debug("%s: remove %d replicas", self, n)
-        old_tasks = set(self.tasks)
+        old_tasks = set(self.engine.state.tasks(self.id, max_age=0))
 
         self.desired_replicas -= n
-        time.sleep(5)  # wait for Docker to register change
-        if wait:
-            self.wait()
+        new_tasks = self._scaled(wait)
+
+        return list(set(new_tasks) - old_tasks)
 
-        new_tasks = set(self.tasks)
+    def _scaled(self, wait):
+        """Waits for Docker to register a change of desired_replicas, and
+        optionally for the tasks to reach their state. Returns the tasks.
+        """
+        desired = self.desired_replicas
+
+        def registered(tasks):
+            return sum(t.desired_state == 'running' for t in tasks) == desired
 
-        return list(new_tasks - old_tasks)
+        tasks = self.engine.state.wait_for(self.id, registered, REGISTER_TIMEOUT)
+        if tasks is None:
+            log.warning("%s: change to %d replicas not registered after %ds",
+                        self, desired, REGISTER_TIMEOUT)
+        if wait:
+            self.wait()
+        return self.tasks if wait or tasks is None else tasks
 
-    def custom_fault(self, number_replicas, fault_details, fault_arguments, wait=False):
-        """Selects `number_replicas` random replicas and sends a fault
-            optionally waits for them to start.
+    def custom_fault(self, number_replicas, fault_details, fault_arguments, wait=False, slots=None,
+                     policy=None):
+        """Selects `number_replicas` replicas following the victim `policy`
+            (or the replicas in `slots`) and sends them a fault.
 
             fault_details and fault_arguments are dictionaries with information required to execute a fault
 
@@ -1225,198 +1491,134 @@ class Service(Resource):
                 "executable_arguments": ["-c"],
                 "fault_script_arguments": ["arg1", "arg2"]
             }
-            """
-        import random
-        from collections import defaultdict
 
+            Returns the answer of each batch, see `send_to_tasks`.
+            """
         log.debug("%s: custom fault in %d tasks", self, number_replicas)
-        self.reload()
+        targets = self.select_tasks(number_replicas, slots, policy)
+        return self.send_to_tasks(targets, 'custom', fault_arguments, **fault_details)
 
-        alive_replicas = self.replicas
-        if alive_replicas < number_replicas:
-            log.error("%s: Can't send custom fault to %d tasks: only %d are alive",
-                      self, number_replicas, alive_replicas)
-            number_replicas = alive_replicas
-
-        tasks_by_node = self.tasks_by_node
-        targets = []
-        for i in range(number_replicas):
-            # find node with most tasks
-            tasks = max(tasks_by_node.values(), key=len)
-            t = random.choice(tasks)
-            targets.append(t)
-            tasks.remove(t)
-
-        # if self.engine.config['mono_kill']:
-        #     for t in kills:
-        #         log.debug('Killing %s...', t)
-        #         t.kill(signal=signal)
-        #     return
-
-        targets_by_node = defaultdict(list)
-        for t in targets:
-            targets_by_node[t.node].append(t)
-
-        # FIXME change kill_batch to batch_size
-        # Divide each node's tasks in batches of size N
-        N = self.engine.config['kill_batch']
-        batches = {}
-        for node, tasks in targets_by_node.items():
-            batches[node] = [tasks[i:i + N] for i in range(0, len(tasks), N)]
-
-        # Slices of commands to send:
-        # [(node1-batch1, node2-batch1, node3-batch1, ...),
-        #  (node1-batch2, node2-batch2, ...), ...]
-        slices = []
-        while True:
-            slice = {}
-            for node, tasks in batches.items():
-                if not tasks:
-                    continue
-                slice[node] = tasks.pop(0)
-            if not slice:
-                break
-            slices.append(slice)
-
-        def thread(node, tasks, fault_details, fault_arguments):
-            # TODO: refactor engine.send() to return the result sent back by
-            # slave (instead of True/False). For 'kill', slave returns list of
-            # killed containers; compare this list to `tasks`.
-            log.debug("%s: custom_fault in %d tasks @ %s",
-                      self, len(tasks), node)
-
-            ids = str.join(',', (t.container[:16] for t in tasks))
-            if node.send('custom', id=ids, mapArrayStringParams=fault_arguments, **fault_details):
-                log.debug("Custom fault injected: {} : {}".format(
-                    fault_details, fault_arguments))
-            else:
-                log.error("Couldn't order CPU waste")
-
-        for slice in slices:
-            threads = []
-            for node, tasks in slice.items():
-                t = threading.Thread(target=thread,
-                                     args=(node, tasks, fault_details,
-                                           fault_arguments),
-                                     name=str(node))
-                log.debug("Starting thread %s...", node)
-                t.start()
-                threads.append(t)
-
-            for t in threads:
-                log.debug("Waiting for thread %s...", t.name)
-                t.join()
-
-        return
-
-    def kill(self, n, signal='TERM'):
-        """Kills `n` tasks with signal `signal`
-
-        Works by selecting the node with the most tasks, selecting a random
-        task, and sending a "kill" command.
-        """
-        import random
-        from collections import defaultdict
+    def kill(self, n, signal='TERM', slots=None, policy=None):
+        """Kills `n` tasks (or the tasks in `slots`) with signal `signal`
 
+        Works by selecting tasks with the victim `policy` (by default, random
+        tasks of the nodes with the most tasks), and sending a "kill"
+        command. Returns the answer of each batch, see `send_to_tasks`.
+        """
         log.debug("%s: Kill %d tasks", self, n)
-        self.reload()
-
-        replicas = self.replicas
-        if replicas < n:
-            log.error("%s: Can't kill %d tasks: only %d are alive",
-                      self, n, replicas)
-            n = replicas
-
-        tasks_by_node = self.tasks_by_node
-        kills = []
-        for i in range(n):
-            # find node with most tasks
-            tasks = max(tasks_by_node.values(), key=len)
-            t = random.choice(tasks)
-            kills.append(t)
-            tasks.remove(t)
+        kills = self.select_tasks(n, slots, policy)
 
         if self.engine.config['mono_kill']:
+            answers = []
             for t in kills:
                 log.debug('Killing %s...', t)
-                t.kill(signal=signal)
-            return
+                ok = t.kill(signal=signal)
+                answers.append((t.node, [t], 'ok' if ok else 'err', None))
+            return answers
+
+        return self.send_to_tasks(kills, 'kill', signal=signal)
+
+    def stop(self, n, slots=None, policy=None):
+        """Stops `n` tasks (or the tasks in `slots`) gracefully, as the
+        slaves do for the stop steps of a churn plan.
+
+        Unlike `rm`, the service keeps its desired replicas and the tasks
+        stopped are the ones selected. Returns the answer of each batch, see
+        `send_to_tasks`.
+        """
+        log.debug("%s: Stop %d tasks", self, n)
+        return self.send_to_tasks(self.select_tasks(n, slots, policy), 'stop')
+
+    def select_tasks(self, n, slots=None, policy=None):
+        """Returns `n` running tasks chosen by the victim `policy`
+        (`victim_policy` by default, see victims.POLICIES), or the running
+        tasks in `slots` (slots of the churn plan, starting at 0).
+        """
+        from .victims import VictimSelector
 
-        kills_by_node = defaultdict(list)
-        for t in kills:
-            kills_by_node[t.node].append(t)
+        self.reload()
+        # listed now, replicas hit by a previous step must not be picked again
+        live_tasks = [t for t in self.engine.state.tasks(self.id, max_age=0) if t.running]
+
+        if slots is None and len(live_tasks) < n:
+            log.error("%s: Can't select %d tasks: only %d are alive",
+                      self, n, len(live_tasks))
+            n = len(live_tasks)
+
+        policy = policy or self.engine.config['victim_policy']
+        targets = VictimSelector(live_tasks).select(n, policy, slots)
+        if slots is not None and len(targets) < len(slots):
+            running = set(t.slot for t in targets)
+            log.error("%s: slots %s are not running", self,
+                      [slot for slot in slots if slot + 1 not in running])
+        return targets
+
+    def send_to_tasks(self, tasks, command, mapArrayStringParams={}, **params):
+        """Sends `command` to the slaves of the nodes running `tasks`.
+
+        The container ids of each node are sent in batches of at most
+        `kill_batch`, pipelined on one connection, and all nodes are sent
+        their batches at the same time.
+
+        Returns a list of (node, tasks, status, msg), one per batch.
+        """
+        from collections import defaultdict
+
+        tasks_by_node = defaultdict(list)
+        for t in tasks:
+            tasks_by_node[t.node].append(t)
 
-        # Divide each node's tasks in batches of size N
         N = self.engine.config['kill_batch']
-        batches = {}
-        for node, tasks in kills_by_node.items():
-            batches[node] = [tasks[i:i + N] for i in range(0, len(tasks), N)]
-
-        # Slices of commands to send:
-        # [(node1-batch1, node2-batch1, node3-batch1, ...),
-        #  (node1-batch2, node2-batch2, ...), ...]
-        slices = []
-        while True:
-            slice = {}
-            for node, tasks in batches.items():
-                if not tasks:
-                    continue
-                slice[node] = tasks.pop(0)
-            if not slice:
-                break
-            slices.append(slice)
-
-        def thread(node, tasks):
-            # TODO: refactor engine.send() to return the result sent back by
-            # slave (instead of True/False). For 'kill', slave returns list of
-            # killed containers; compare this list to `tasks`.
-            log.debug("%s: Killing %d tasks @ %s",
-                      self, len(tasks), node)
-
-            ids = str.join(',', (t.container[:16] for t in tasks))
-            if node.send('kill', id=ids, signal=signal):
-                log.debug("Tasks killed!")
-            else:
-                log.error("Couldn't kill tasks")
+        batches = []  # [(node, [[task, ...], ...]), ...]
+        for node, node_tasks in tasks_by_node.items():
+            batches.append((node, [node_tasks[i:i + N] for i in range(0, len(node_tasks), N)]))
+            log.debug("%s: %s in %d tasks @ %s", self, command, len(node_tasks), node)
 
-        for slice in slices:
-            threads = []
-            for node, tasks in slice.items():
-                t = threading.Thread(target=thread,
-                                     args=(node, tasks),
-                                     name=str(node))
-                log.debug("Starting thread %s...", node)
-                t.start()
-                threads.append(t)
+        def batch_params(batch):
+            return dict(params, id=','.join(t.container[:16] for t in batch))
 
-            for t in threads:
-                log.debug("Waiting for thread %s...", t.name)
-                t.join()
+        answers = self.engine.send_node_commands(
+            [(node, [(command, mapArrayStringParams, batch_params(batch)) for batch in node_batches])
+             for node, node_batches in batches])
 
-        return
+        results = []
+        for (node, node_batches), node_answers in zip(batches, answers):
+            for batch, (status, msg) in zip(node_batches, node_answers):
+                if status != 'ok':
+                    log.error("%s: %s failed in %d tasks @ %s: %s",
+                              self, command, len(batch), node, msg)
+                results.append((node, batch, status, msg))
+        return results
 
     def remove(self):
         """Terminates service."""
         self.engine.remove_service(self.id)
 
-    def wait(self, sleep=0.5, max_sleep=None):
+    def wait_removed(self, max_sleep=None):
+        """Waits until the tasks of the removed service are gone, which is
+        when their containers are shut down.
+
+        Returns False if a delay of max_sleep has been reached first.
+        """
+        if self.engine.state.wait_for(self.id, lambda tasks: not tasks, max_sleep) is None:
+            log.warning("%s: tasks still running after removal", self)
+            return False
+        return True
+
+    def wait(self, max_sleep=None):
         """Waits for tasks to start/terminate.
 
-        Loops until all tasks reached their expected state (and returns True),
+        Waits until all tasks reached their expected state (and returns True),
         or a delay of max_sleep has been reached (and returns False)
         """
-        total_sleep = 0
-        while not all(t.ok for t in self.tasks):
-            log.debug("%s: wait: %d/%d", self,
-                      sum(t.ok for t in self.tasks),
-                      len(self.tasks))
-            time.sleep(sleep)
-            total_sleep += sleep
-            if max_sleep and total_sleep >= max_sleep:
-                log.debug("%s: wait: timeout", self)
-                return False
-        else:
-            return True
+        def ready(tasks):
+            log.debug("%s: wait: %d/%d", self, sum(t.ok for t in tasks), len(tasks))
+            return all(t.ok for t in tasks)
+
+        if self.engine.state.wait_for(self.id, ready, max_sleep) is None:
+            log.debug("%s: wait: timeout", self)
+            return False
+        return True
 
     def __repr__(self):
         return super().__repr__() + ":" + self.name
@@ -1466,33 +1668,34 @@ class Task(Resource):
         if id is None:
             return None
         else:
-            return self.engine.node(self.node_id)
+            return self.engine.cached_node(self.node_id)
 
     @property
     def service_id(self):
         return self['ServiceID']
 
+    @property
+    def slot(self):
+        """Slot of the task in its service, starting at 1"""
+        return self.get('Slot')
+
     def kill(self, signal='TERM'):
         return self.node.send('kill', id=self.container, signal=signal)
 
-    def wait(self, sleep=0.5, max_sleep=None):
+    def wait(self, max_sleep=None):
         """Waits until task's desired state matches its state
 
-        Loops until task starts/stops running (and returns True),
+        Waits until task starts/stops running (and returns True),
         or a delay of max_sleep has been reached (and returns False)
         """
-        self.reload()
-        total_sleep = 0
-        while not self.ok:
-            self.reload()
+        def ready(tasks):
             log.debug("%s: wait: %s/%s", self, self.state, self.desired_state)
-            time.sleep(sleep)
-            total_sleep += sleep
-            if max_sleep and total_sleep >= max_sleep:
-                log.debug("%s: wait: timeout", self)
-                return False
-        else:
-            return True
+            return self.ok
+
+        if self.engine.state.wait_for(self.service_id, ready, max_sleep) is None:
+            log.debug("%s: wait: timeout", self)
+            return False
+        return True
 
     def __repr__(self):
         return (super().__repr__()
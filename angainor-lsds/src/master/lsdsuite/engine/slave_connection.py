@@ -0,0 +1,245 @@
+import asyncio
+import json
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Frames are prefixed by their length, 4 bytes big endian
+FRAME_HEADER = struct.Struct(">I")
+
+
+class LegacySlave(Exception):
+    """The slave only speaks the close-delimited protocol."""
+
+
+def _frame_size(header):
+    if header[:1] == b'{':
+        # old slave, answered with an error to the unknown framing
+        raise LegacySlave()
+    if len(header) < FRAME_HEADER.size:
+        raise ConnectionResetError("Connection closed by slave")
+    return FRAME_HEADER.unpack(header)[0]
+
+
+class SlaveConnection(object):
+    """A keep-alive connection to a slave using the framed protocol.
+
+    Requests and responses are JSON documents prefixed by their length.
+    Several requests can be sent before reading the responses, which the
+    slave sends back in order.
+    """
+
+    def __init__(self, address, timeout):
+        self.sock = socket.create_connection(address, timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile('rb')
+        # number of requests sent on this connection
+        self.used = 0
+
+    def send(self, messages):
+        data = b''.join(FRAME_HEADER.pack(len(m)) + m for m in messages)
+        self.sock.sendall(data)
+        self.used += len(messages)
+
+    def recv(self):
+        size = _frame_size(self.file.read(FRAME_HEADER.size))
+        data = self.file.read(size)
+        if len(data) < size:
+            raise ConnectionResetError("Connection closed by slave")
+        return json.loads(data.decode())
+
+    def stale(self):
+        """Whether the slave closed the idle connection (e.g. restarted)."""
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return bool(readable)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class SlavePool(object):
+    """Pool of up to `size` keep-alive connections to the slave at `address`.
+
+    Broken connections are dropped and re-opened on the next request. If the
+    slave doesn't support the framed protocol, falls back to one connection
+    per request (the slave closes it after answering).
+    """
+
+    def __init__(self, address, size=4, timeout=60):
+        self.address = address
+        self.size = size
+        self.timeout = timeout
+        self.legacy = False
+        # seconds until the first answer of the last asynchronous request
+        self.rtt = None
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        # (reader, writer) pairs, only used from the engine's event loop
+        self._async_idle = []
+        self._async_slots = None
+
+    def request(self, message):
+        """Sends a single request, returns the response as a dict."""
+        return self.pipeline([message])[0]
+
+    def pipeline(self, messages):
+        """Sends all `messages` on one connection before reading any response.
+
+        Returns the responses, in the same order.
+        """
+        messages = [json.dumps(m).encode() for m in messages]
+        if self.legacy:
+            return [self._request_legacy(m) for m in messages]
+
+        with self._slots:
+            try:
+                return self._pipeline(messages)
+            except LegacySlave:
+                log.info("Slave %s:%d doesn't support keep-alive connections", *self.address)
+                self.legacy = True
+        return [self._request_legacy(m) for m in messages]
+
+    def _pipeline(self, messages):
+        conn = self._get()
+        reused = conn.used > 0
+        try:
+            conn.send(messages)
+        except (ConnectionError, BrokenPipeError) as e:
+            conn.close()
+            if not reused:
+                raise
+            # idle connection closed by the slave (e.g. restarted), which
+            # didn't get the requests, retry once on a new connection
+            log.debug("Reconnecting to slave %s:%d: %s", self.address[0], self.address[1], e)
+            conn = self._connect()
+            try:
+                conn.send(messages)
+            except BaseException:
+                conn.close()
+                raise
+        except BaseException:
+            conn.close()
+            raise
+
+        # once sent, the slave may have run the requests (kill, custom,
+        # start_run_at, ...), errors are never retried
+        try:
+            responses = [conn.recv() for _ in messages]
+        except BaseException:
+            conn.close()
+            raise
+
+        self._put(conn)
+        return responses
+
+    async def async_pipeline(self, messages, timeout=None):
+        """Coroutine version of `pipeline`, on up to `size` keep-alive
+        connections of its own. They belong to the running event loop, which
+        must be the same for every call (see Engine.run_coroutine).
+
+        Raises asyncio.TimeoutError if the answers take more than `timeout`
+        seconds (the pool timeout by default).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        messages = [json.dumps(m).encode() for m in messages]
+        if not self.legacy:
+            try:
+                return await asyncio.wait_for(self._async_pipeline(messages), timeout)
+            except LegacySlave:
+                log.info("Slave %s:%d doesn't support keep-alive connections", *self.address)
+                self.legacy = True
+        return [await asyncio.wait_for(self._async_request_legacy(m), timeout)
+                for m in messages]
+
+    async def _async_pipeline(self, messages):
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.size)
+
+        async with self._async_slots:
+            reader, writer = await self._async_get()
+            try:
+                sent = time.monotonic()
+                writer.write(b''.join(FRAME_HEADER.pack(len(m)) + m for m in messages))
+                await writer.drain()
+
+                responses = []
+                for _ in messages:
+                    try:
+                        header = await reader.readexactly(FRAME_HEADER.size)
+                    except asyncio.IncompleteReadError as e:
+                        header = e.partial
+                    size = _frame_size(header)
+                    try:
+                        data = await reader.readexactly(size)
+                    except asyncio.IncompleteReadError:
+                        raise ConnectionResetError("Connection closed by slave")
+                    if not responses:
+                        self.rtt = time.monotonic() - sent
+                    responses.append(json.loads(data.decode()))
+            except BaseException:
+                # also on timeouts, answers may still come on this connection
+                writer.close()
+                raise
+
+            self._async_idle.append((reader, writer))
+            return responses
+
+    async def _async_get(self):
+        while self._async_idle:
+            reader, writer = self._async_idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            log.debug("Slave %s:%d closed an idle connection", *self.address)
+            writer.close()
+        return await asyncio.open_connection(*self.address)
+
+    async def _async_request_legacy(self, message):
+        # includes the connection set up, as every legacy request needs one
+        sent = time.monotonic()
+        reader, writer = await asyncio.open_connection(*self.address)
+        try:
+            writer.write(message)
+            await writer.drain()
+            writer.write_eof()
+            response = json.loads((await reader.read()).decode())
+            self.rtt = time.monotonic() - sent
+            return response
+        finally:
+            writer.close()
+
+    def _request_legacy(self, message):
+        with socket.create_connection(self.address, timeout=self.timeout) as sock:
+            sock.sendall(message)
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile('rb') as f:
+                return json.loads(f.read().decode())
+
+    def _connect(self):
+        return SlaveConnection(self.address, self.timeout)
+
+    def _get(self):
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.stale():
+                    return conn
+                log.debug("Slave %s:%d closed an idle connection", *self.address)
+                conn.close()
+        return self._connect()
+
+    def _put(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class ClusterState(object):
+    """Tasks of the cluster, shared by the whole engine.
+
+    A single watcher thread lists all tasks at once, as soon as the Docker
+    events stream reports a change (service updated, container started or
+    stopped, ...), every `interval` seconds while someone waits for tasks to
+    change (the manager doesn't get the events of containers on the other
+    nodes) and every `resync` seconds otherwise. Readers get the last
+    listing, or list the tasks themselves when it is older than `max_age`
+    seconds.
+    """
+
+    def __init__(self, engine, max_age=1, interval=0.5, resync=5):
+        self.engine = engine
+        self.max_age = max_age
+        self.interval = interval
+        self.resync = resync
+        self._cond = threading.Condition()
+        self._list_lock = threading.Lock()
+        self._changed = threading.Event()
+        self._waiters = 0
+        self._listed = None  # monotonic time the last listing started
+        self._tasks = {}  # {service_id: [Task, ...]}
+        self._threads = None
+
+    def tasks(self, service_id, max_age=None):
+        """Tasks of the service, listed at most `max_age` seconds ago."""
+        max_age = self.max_age if max_age is None else max_age
+        start = time.monotonic()
+        with self._cond:
+            self._start()
+            fresh = self._listed is not None and start - self._listed <= max_age
+        if not fresh:
+            self._refresh(start - max_age)
+        with self._cond:
+            return list(self._tasks.get(service_id, []))
+
+    def wait_for(self, service_id, predicate, timeout=None):
+        """Waits until `predicate(tasks)` is true for the tasks of the service,
+        listed after the call.
+
+        Returns the tasks, or None if `timeout` seconds went by first.
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._cond:
+            self._start()
+            self._waiters += 1
+            self._changed.set()
+            try:
+                while True:
+                    if self._listed is not None and self._listed >= start:
+                        tasks = list(self._tasks.get(service_id, []))
+                        if predicate(tasks):
+                            return tasks
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+    def _refresh(self, after=None):
+        """Lists all tasks, unless someone else did since `after`."""
+        from .docker import Task
+
+        with self._list_lock:
+            if after is not None and self._listed is not None and self._listed >= after:
+                return
+            started = time.monotonic()
+            data = self.engine.client.tasks()
+
+            tasks = {}
+            for d in data:
+                task = self.engine._update_cache(Task, d)
+                tasks.setdefault(task.service_id, []).append(task)
+
+            # forget the tasks that were removed
+            cache = self.engine._cache[Task]
+            listed = set(d['ID'] for d in data)
+            for id in [id for id in cache if id not in listed]:
+                del cache[id]
+
+            with self._cond:
+                self._listed = started
+                self._tasks = tasks
+                self._cond.notify_all()
+
+    def _start(self):
+        if self._threads is not None:
+            return
+        self._threads = [threading.Thread(target=self._run, name="cluster-state", daemon=True),
+                         threading.Thread(target=self._watch_events, name="cluster-state-events",
+                                          daemon=True)]
+        for t in self._threads:
+            t.start()
+
+    def _run(self):
+        while True:
+            self._changed.wait(self.interval if self._waiters else self.resync)
+            self._changed.clear()
+            try:
+                self._refresh()
+            except Exception as e:
+                log.warning("Listing tasks failed: %s", e)
+
+    def _watch_events(self):
+        try:
+            for _ in self.engine.client.events(decode=True,
+                                               filters={'type': ['service', 'container', 'node']}):
+                self._changed.set()
+        except Exception as e:
+            log.debug("Docker events stream closed, polling tasks only: %s", e)
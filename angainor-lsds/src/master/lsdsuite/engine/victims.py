@@ -0,0 +1,119 @@
+import heapq
+import random
+
+# Node label giving the rack of a node, for the rack policy
+RACK_LABEL = 'rack'
+
+
+class TaskGroup(list):
+    """Tasks of a node, taken in random order."""
+
+    def pop_victim(self, rng):
+        # swap with the last one, so that removing is O(1)
+        i = rng.randrange(len(self))
+        self[i], self[-1] = self[-1], self[i]
+        return self.pop()
+
+
+class LoadHeap(object):
+    """Groups of tasks (task groups or other heaps) in a max-heap by the
+    number of tasks they have left.
+
+    Taking a victim is O(log groups): the largest group is popped, gives a
+    victim and is pushed back with its new size.
+    """
+
+    def __init__(self, groups):
+        self._groups = {key: group for key, group in groups.items() if len(group)}
+        self._size = sum(len(group) for group in self._groups.values())
+        # ties go to the group that has waited longest
+        self._heap = [(-len(group), i, key) for i, (key, group) in enumerate(self._groups.items())]
+        self._order = len(self._heap)
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return self._size
+
+    def pop_victim(self, rng):
+        return self.pop_victims(1, rng)[0]
+
+    def pop_victims(self, n, rng, pack=False):
+        """Takes `n` victims, one at a time from the largest group, or with
+        `pack`, as many as possible from the largest group before the next.
+        """
+        victims = []
+        while len(victims) < n and self._heap:
+            _, _, key = heapq.heappop(self._heap)
+            group = self._groups[key]
+            count = min(len(group) if pack else 1, n - len(victims))
+            for _ in range(count):
+                victims.append(group.pop_victim(rng))
+            self._size -= count
+            if len(group):
+                heapq.heappush(self._heap, (-len(group), self._order, key))
+                self._order += 1
+        return victims
+
+
+def by_node(tasks):
+    groups = {}
+    for t in tasks:
+        groups.setdefault(t.node_id, TaskGroup()).append(t)
+    return groups
+
+
+def spread(tasks, n, rng, slots=None):
+    """Victims taken from the nodes with the most tasks left."""
+    return LoadHeap(by_node(tasks)).pop_victims(n, rng)
+
+
+def pack(tasks, n, rng, slots=None):
+    """Victims on as few nodes as possible, starting with the node with
+    the most tasks.
+    """
+    return LoadHeap(by_node(tasks)).pop_victims(n, rng, pack=True)
+
+
+def rack(tasks, n, rng, slots=None):
+    """Victims spread over racks (`rack` node label), then over the nodes
+    of each rack. Nodes without the label are racks of their own.
+    """
+    racks = {}
+    for node_id, group in by_node(tasks).items():
+        node = group[0].node
+        rack_id = (node.labels.get(RACK_LABEL) if node is not None else None) or node_id
+        racks.setdefault(rack_id, {})[node_id] = group
+    return LoadHeap({rack_id: LoadHeap(nodes) for rack_id, nodes in racks.items()}) \
+        .pop_victims(n, rng)
+
+
+def specific(tasks, n, rng, slots=None):
+    """The tasks in `slots` (slots of the churn plan, starting at 0)."""
+    by_slot = {t.slot: t for t in tasks}
+    return [by_slot[slot + 1] for slot in slots if slot + 1 in by_slot]
+
+
+POLICIES = {
+    'spread': spread,
+    'pack': pack,
+    'rack': rack,
+    'specific': specific,
+}
+
+
+class VictimSelector(object):
+    """Chooses which of `tasks` a fault hits, following a policy."""
+
+    def __init__(self, tasks, rng=None):
+        self.tasks = list(tasks)
+        self.rng = rng or random
+
+    def select(self, n, policy='spread', slots=None):
+        if slots is not None:
+            policy = 'specific'
+        elif policy == 'specific':
+            raise ValueError("specific policy needs slots")
+        if policy not in POLICIES:
+            raise ValueError("Unsupported victim policy: {}, possibilities: {}".format(
+                policy, list(POLICIES)))
+        return POLICIES[policy](self.tasks, n, self.rng, slots)
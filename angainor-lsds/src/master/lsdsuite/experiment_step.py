@@ -38,6 +38,10 @@ class EndStep(SimpleStep):
 class MarkStep(SimpleStep):
     operation = "mark"
 
+    def __init__(self, fault_time, message):
+        super().__init__(fault_time)
+        self.message = message
+
 
 class ServiceChangeStep(ExperimentStep):
     # self.number_replicas
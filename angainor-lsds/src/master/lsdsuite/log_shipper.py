@@ -0,0 +1,67 @@
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class LogShipper(object):
+    """Copies the logs of the current run from the nodes while it runs.
+
+    One thread per node keeps an SSH session open and, every `interval`
+    seconds, appends to the local node log whatever was written to the remote
+    log since the previous copy (resuming from the local file size). When the
+    run ends, Benchmark.get_logs only has to fetch the remaining delta.
+    """
+
+    def __init__(self, benchmark, interval=10):
+        self.benchmark = benchmark
+        self.interval = interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        from os import makedirs
+        from os.path import dirname
+
+        paths = self.benchmark.node_log_paths
+        makedirs(dirname(paths[0]), exist_ok=True)
+
+        self._stop.clear()
+        for i, node in enumerate(self.benchmark.nodes):
+            t = threading.Thread(target=self._ship, args=(node, i, paths[i]),
+                                 name="log-shipper-{}".format(i), daemon=True)
+            t.start()
+            self._threads.append(t)
+        log.info("%s: shipping logs every %ds", self.benchmark, self.interval)
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def _ship(self, node, i, local_path):
+        from paramiko import SSHException
+        from . import get_ssh
+
+        benchmark = self.benchmark
+        remote_path = benchmark.remote_log_path
+        local = benchmark.is_local_node(node, i)
+        ssh = None
+        shipped = 0
+
+        while not self._stop.wait(self.interval):
+            try:
+                if ssh is None and not local:
+                    ssh = get_ssh(node)
+                shipped += benchmark._copy_log(ssh, local_path, remote_path, resume=True)
+            except (SSHException, OSError, EOFError) as e:
+                # not fatal, whatever is missing is fetched at the end of the run
+                log.debug("%s: node %d: shipping logs failed: %s", benchmark, i, e)
+                if ssh is not None:
+                    ssh.close()
+                ssh = None
+
+        if ssh is not None:
+            ssh.close()
+        log.debug("%s: node %d: shipped %d bytes during the run", benchmark, i, shipped)
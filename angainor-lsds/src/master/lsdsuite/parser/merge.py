@@ -0,0 +1,47 @@
+import heapq
+import logging
+from contextlib import ExitStack
+
+log = logging.getLogger(__name__)
+
+
+def _timestamp(line):
+    # lines start with the timestamp, followed by a space
+    return line.split(' ', 1)[0]
+
+
+def open_log(path):
+    """Opens a log for reading lines, gzip-compressed if it ends in .gz."""
+    if path.endswith('.gz'):
+        import gzip
+        return gzip.open(path, 'rt')
+    return open(path)
+
+
+def merge_logs(paths, out=None):
+    """Merges node logs, each already sorted by time, into a single stream.
+
+    Yields the lines of all logs in time order. Each file is read
+    sequentially and only the current line of each file is kept in memory
+    (heap-based k-way merge on the timestamp prefix, same order as
+    `sort -m`). If `out` is given, merged lines are also written to it.
+    """
+    with ExitStack() as stack:
+        files = [stack.enter_context(open_log(path)) for path in paths]
+        if out is not None:
+            out = stack.enter_context(open(out, 'w'))
+
+        for line in heapq.merge(*files, key=_timestamp):
+            if not line.endswith('\n'):
+                # last line of a file without trailing newline
+                line += '\n'
+            if out is not None:
+                out.write(line)
+            yield line
+
+
+def write_merged_log(paths, out):
+    """Merges node logs at `paths` into the file `out`."""
+    log.debug("Merging %d logs into %s", len(paths), out)
+    for _ in merge_logs(paths, out):
+        pass
@@ -1,15 +1,105 @@
 import json
+from contextlib import ExitStack
 from os.path import join
 
 import pandas
 import logging
 
+from .merge import merge_logs, open_log
+
 log = logging.getLogger(__name__)
 
+# Number of log lines loaded at once, bounds memory used while loading
+CHUNK_SIZE = 100000
+
+# Supported formats for the processed tables
+# parquet is columnar and much faster to reload, but requires pyarrow
+OUTPUT_FORMATS = ["json", "parquet"]
+
+# Columns with few distinct values, dictionary encoded in columnar output
+DICTIONARY_COLUMNS = ["container_id", "hostname", "service", "slot", "action"]
+
+# Rows per parquet row group. Tables are written sorted by time and each row
+# group keeps min/max statistics of the time column, which lets readers skip
+# the row groups outside a time range
+ROW_GROUP_SIZE = 100000
+
+
+def load_table(directory_path, name, columns=None, start=None, end=None):
+    """Loads a table written by Parser.process_file as a DataFrame.
+
+    Only the `columns` listed are read (all of them if None). When `start`
+    and/or `end` are given, only rows with start <= time < end are returned
+    (time is in seconds since the beginning of the experiment). For parquet
+    output, row groups outside of the time range are not even read.
+    """
+    from os.path import exists
+
+    filters = []
+    if start is not None:
+        filters.append(("time", ">=", start))
+    if end is not None:
+        filters.append(("time", "<", end))
+
+    file_path = join(directory_path, name + ".parquet")
+    if exists(file_path):
+        return pandas.read_parquet(file_path, columns=columns,
+                                   filters=filters or None)
+
+    # fallback to JSON output, everything has to be loaded anyway
+    dataframe = pandas.read_json(join(directory_path, name + ".json"),
+                                 orient="records")
+    if start is not None:
+        dataframe = dataframe[dataframe.time >= start]
+    if end is not None:
+        dataframe = dataframe[dataframe.time < end]
+    if columns is not None:
+        dataframe = dataframe[columns]
+    return dataframe
+
+
+def _load_shard(path):
+    """Loads a single node log, runs in a worker process.
+
+    Returns the earliest time found in the log and the loaded entries of each
+    table, sorted by time. Times are returned as nanoseconds since epoch,
+    which are much cheaper to send back to the main process than Timestamps.
+    """
+    parser = Parser(path)
+    min_time = parser._load_entries(path)
+    parser._sort_by_time()
+
+    tables = {}
+    for name in Parser.time_tables:
+        array = getattr(parser, name)
+        for entry in array:
+            entry["time"] = entry["time"].value
+        tables[name] = array
+
+    if min_time is not None:
+        min_time = min_time.value
+    return min_time, tables
+
 
 class Parser(object):
-    def __init__(self, filename):
+    # tables with a time column, loaded from the logs
+    time_tables = ["logs", "marks", "individual_container_stats", "events", "host_stats"]
+
+    def __init__(self, filename, output_format="json", processes=None):
+        """`filename` is either the merged log file or a list with the log
+        file of each node. Node logs are loaded in parallel, by up to
+        `processes` worker processes (defaults to the number of CPUs).
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError("Unsupported output format: " + str(output_format))
+
         self.filename = filename
+        if isinstance(filename, str):
+            self.filenames = [filename]
+        else:
+            self.filenames = list(filename)
+        self.output_format = output_format
+        self.processes = processes
         self.logs = []
         self.marks = []
         self.individual_container_stats = []
@@ -19,7 +109,13 @@ class Parser(object):
 
     def process_file(self, directory_path):
         log.info("Loading " + str(self.filename))
-        self._load(self.filename)
+        if len(self.filenames) == 1:
+            self._load(self.filenames[0])
+        elif self.processes == 1:
+            # single process, stream the merged logs without writing them
+            self._load(merge_logs(self.filenames))
+        else:
+            self._load_shards(self.filenames)
 
         log.info("Sorting data")
         self._sort_by_time()
@@ -66,59 +162,160 @@ class Parser(object):
         ]
         log.info("Writing to files in directory: " + str(directory_path))
 
+        if self.output_format == "parquet":
+            extension, dump = ".parquet", self._dump_parquet_to_file
+        else:
+            extension, dump = ".json", self._dump_json_to_file
+
         for filename, array in pairs:
-            file_path = join(directory_path, filename + ".json")
+            file_path = join(directory_path, filename + extension)
             log.info("Writing to file " + str(file_path))
-            self._dump_json_to_file(file_path, array)
+            dump(file_path, array)
 
     def _load(self, path):
-        min_time = None
-        with open(path) as f:
-            for line in f:
-                # try:
-                    line = line.strip()
-                    split = line.split('\t', 2)
-                    while len(split) < 3:
-                        split.append("")
-                    time, id, msg = split
-                    time, subject = time.split(' ', 1)
-                    time = pandas.to_datetime(time)
-                    if min_time is None or time < min_time:
-                        min_time = time
-
-                    subject = subject[1:-1]  # removes brackets
-
-                    if subject == 'LOG':
-                        container_id = id
-                        self._parse_log_msg(time, container_id, msg)
-
-                    if subject == 'EVENT':
-                        event = json.loads(msg)
-                        if event['Type'] != 'container':
-                            # only interested in container events
-                            continue
-                        self._parse_container_event(time, id, event)
-
-                    if subject == 'STATS':
-                        stats = json.loads(msg)
-                        container_id = id
-                        self._parse_individual_container_stats(time, container_id, stats)
-
-                    if subject == 'HOST':
-                        hostname = id
-                        host_stats = json.loads(msg)
-                        self._parse_host_stats(time, hostname, host_stats)
-
-                    if subject == 'MARK':
-                        mark = json.loads(msg)
-                        hostname = id
-                        self._parse_mark(time, hostname, mark)
-
-                # except Exception as e:
-                #     log.error("Could not parse line: " + str(line))
-                #     log.error(e)
+        min_time = self._load_entries(path)
         self._process_relative_time(min_time)
 
+    def _load_shards(self, paths):
+        """Loads each node log in its own worker process, then merges the
+        loaded entries of all nodes.
+
+        Each node log is already sorted by time, so a k-way merge of the
+        (sorted) tables loaded by each worker keeps the result sorted.
+        """
+        import heapq
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # not forked, the master has threads of its own (slave connections,
+        # task state, ...) that may hold locks at fork time
+        with ProcessPoolExecutor(max_workers=self.processes,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            shards = list(executor.map(_load_shard, paths))
+
+        min_times = [min_time for min_time, _ in shards if min_time is not None]
+        min_time = min(min_times) if min_times else None
+
+        def get_time(val):
+            return val["time"]
+
+        for name in self.time_tables:
+            merged = heapq.merge(*(tables[name] for _, tables in shards), key=get_time)
+            array = []
+            for entry in merged:
+                # nanoseconds since epoch to seconds since beginning of experiment
+                # (same conversion as _process_relative_time)
+                entry["time"] = pandas.Timedelta(entry["time"] - min_time).total_seconds()
+                array.append(entry)
+            setattr(self, name, array)
+
+    def _load_entries(self, path):
+        """Loads all entries of the log at `path` (a file path or an iterable
+        of lines), with absolute times.
+
+        Returns the earliest time found (None if the log is empty).
+        """
+        min_time = None
+        for chunk in self._read_chunks(path):
+            chunk_min_time = chunk.time.min()
+            if min_time is None or chunk_min_time < min_time:
+                min_time = chunk_min_time
+
+            for subject, entries in chunk.groupby('subject', sort=False):
+                loader = self._loaders.get(subject)
+                if loader is not None:
+                    loader(self, entries)
+
+        return min_time
+
+    @staticmethod
+    def _read_chunks(path, chunk_size=CHUNK_SIZE):
+        """Reads the log `chunk_size` lines at a time.
+
+        `path` is either a file path (plain or .gz) or an iterable of lines
+        (e.g. merge_logs).
+        Yields one DataFrame per chunk, with columns time, subject, id and msg.
+        Lines are split and timestamps converted in bulk for the whole chunk,
+        so only one chunk of raw lines is kept in memory at any time.
+        """
+        from itertools import islice
+
+        with ExitStack() as stack:
+            if isinstance(path, str):
+                lines = stack.enter_context(open_log(path))
+            else:
+                lines = iter(path)
+
+            while True:
+                chunk = list(islice(lines, chunk_size))
+                if not chunk:
+                    break
+                yield Parser._split_lines(chunk)
+
+    @staticmethod
+    def _split_lines(lines):
+        lines = pandas.Series(lines).str.strip()
+        # time and subject are separated by a space, other fields by tabs
+        # msg may itself contain tabs
+        fields = lines.str.split('\t', n=2, expand=True).reindex(columns=range(3)).fillna("")
+        header = fields[0].str.split(' ', n=1, expand=True).reindex(columns=range(2)).fillna("")
+
+        return pandas.DataFrame({
+            'time': pandas.to_datetime(header[0], utc=True, format='ISO8601'),
+            'subject': header[1].str[1:-1],  # removes brackets
+            'id': fields[1],
+            'msg': fields[2],
+        })
+
+    def _load_logs(self, entries):
+        for time, container_id, msg in zip(entries.time, entries.id, entries.msg):
+            self._parse_log_msg(time, container_id, msg)
+
+    def _load_events(self, entries):
+        for time, id, msg in zip(entries.time, entries.id, entries.msg):
+            event = json.loads(msg)
+            if event['Type'] != 'container':
+                # only interested in container events
+                continue
+            self._parse_container_event(time, id, event)
+
+    def _load_individual_container_stats(self, entries):
+        all_stats = [json.loads(msg) for msg in entries.msg]
+
+        # converting read timestamps one by one is too slow, do it for the
+        # whole chunk at once. preread starts with 0001 for the first sample
+        # of each container (out of bounds for pandas, interval unknown)
+        preread = pandas.Series([stats['preread'] for stats in all_stats])
+        first_sample = preread.str.startswith("0001")
+        read = pandas.to_datetime(pandas.Series([stats['read'] for stats in all_stats]),
+                                  utc=True, format='ISO8601')
+        preread = pandas.to_datetime(preread.mask(first_sample), utc=True, format='ISO8601')
+        intervals = (read - preread) // pandas.Timedelta(nanoseconds=1)
+
+        for time, container_id, stats, interval, first in zip(entries.time, entries.id, all_stats,
+                                                              intervals, first_sample):
+            interval = None if first else interval
+            self._parse_individual_container_stats(time, container_id, stats, interval)
+
+    def _load_host_stats(self, entries):
+        for time, hostname, msg in zip(entries.time, entries.id, entries.msg):
+            host_stats = json.loads(msg)
+            self._parse_host_stats(time, hostname, host_stats)
+
+    def _load_marks(self, entries):
+        for time, hostname, msg in zip(entries.time, entries.id, entries.msg):
+            mark = json.loads(msg)
+            self._parse_mark(time, hostname, mark)
+
+    # dictionary that selects how entries are loaded, depending on their subject
+    _loaders = {
+        'LOG': _load_logs,
+        'EVENT': _load_events,
+        'STATS': _load_individual_container_stats,
+        'HOST': _load_host_stats,
+        'MARK': _load_marks,
+    }
+
     def _parse_container_event(self, time, container_id, event):
         if event["Action"] not in ["start", "die"]:
             # ignore
@@ -196,20 +393,18 @@ class Parser(object):
         processed_mark = dict(time=time, hostname=hostname, msg=mark_msg)
         self.marks.append(processed_mark)
 
-    def _parse_individual_container_stats(self, time, container_id, stats):
+    # interval is the time between read and preread, in nanoseconds
+    # None if there is no previous sample
+    def _parse_individual_container_stats(self, time, container_id, stats, interval):
         # print(stats["networks"])
 
-        preread = stats['preread']
-        if preread.startswith("0001"):
+        if interval is None:
             cpu = 0
         else:
-            timedelta = (pandas.to_datetime(stats['read']) - pandas.to_datetime(preread)).to_timedelta64()
-            timedelta = timedelta.astype('int')
-
             cpu = (stats['cpu_stats']['cpu_usage']['total_usage']
                    - stats['precpu_stats']['cpu_usage']['total_usage'])
             # n=len(msg['cpu_stats']['cpu_usage']['percpu_usage'])
-            cpu /= timedelta
+            cpu /= interval
 
         # incoming
         rx_bytes = 0
@@ -246,33 +441,14 @@ class Parser(object):
         self.individual_container_stats.append(container_stats)
 
     def _process_container_stats(self):
-        dataframe = pandas.DataFrame(self.individual_container_stats)
-        dataframe = dataframe.sort_values(by='time')
-
-        processed_individual = []
-        containers_ids = self._get_container_ids()
-        for container in containers_ids:
-            container_dataframe = dataframe[dataframe.container_id == container]
-
-            container_dataframe = container_dataframe[["time", "container_id", "cpu", "mem", "rx_bytes", "rx_packets", "rx_dropped", "tx_bytes", "tx_packets", "tx_dropped"]]
-            # , "read_and_write_byte"
-
-            # CPU alread comes pre processed
-            container_dataframe["time_diff"] = container_dataframe.time.diff()
-            # process bandwidth
-            container_dataframe["rx_bytes"] = container_dataframe["rx_bytes"].diff().divide(container_dataframe["time_diff"])
-            container_dataframe["rx_packets"] = container_dataframe["rx_packets"].diff().divide(container_dataframe["time_diff"])
-            container_dataframe["rx_dropped"] = container_dataframe["rx_dropped"].diff().divide(container_dataframe["time_diff"])
-            container_dataframe["tx_bytes"] = container_dataframe["tx_bytes"].diff().divide(container_dataframe["time_diff"])
-            container_dataframe["tx_packets"] = container_dataframe["tx_packets"].diff().divide(container_dataframe["time_diff"])
-            container_dataframe["tx_dropped"] = container_dataframe["tx_dropped"].diff().divide(container_dataframe["time_diff"])
-            # first one has NaN has values
-            container_dataframe = container_dataframe.iloc[1:]
-
-            processed_container_stats = container_dataframe.to_dict('r')
-            processed_individual += processed_container_stats
-
-        self.individual_container_stats = processed_individual
+        columns = ["time", "container_id", "cpu", "mem", "rx_bytes", "rx_packets", "rx_dropped",
+                   "tx_bytes", "tx_packets", "tx_dropped"]
+        # , "read_and_write_byte"
+        # CPU alread comes pre processed
+        rate_columns = ["rx_bytes", "rx_packets", "rx_dropped", "tx_bytes", "tx_packets", "tx_dropped"]
+
+        self.individual_container_stats = self._process_rates(
+            self.individual_container_stats, "container_id", self._get_container_ids(), columns, rate_columns)
 
     def _parse_host_stats(self, time, hostname, host_stats):
 
@@ -293,28 +469,43 @@ class Parser(object):
         self.host_stats.append(processed_host_stats)
 
     def _process_host_stats(self):
-        dataframe = pandas.DataFrame(self.host_stats)
-        dataframe = dataframe.sort_values(by='time')
-
-        processed_individual = []
-        nodes_hostname = self._get_nodes_hostname()
-        for host in nodes_hostname:
-            host_dataframe = dataframe[dataframe.hostname == host]
-            host_dataframe = host_dataframe[["time", "hostname", "cpu", "mem", "netOut", "netIn", "diskRead", "diskWrite"]]
-
-            # CPU already comes pre processed
-            host_dataframe["time_diff"] = host_dataframe.time.diff()
-            # process bandwidth
-            host_dataframe["netOut"] = host_dataframe["netOut"].diff().divide(host_dataframe["time_diff"])
-            host_dataframe["netIn"] = host_dataframe["netIn"].diff().divide(host_dataframe["time_diff"])
-            host_dataframe["diskRead"] = host_dataframe["diskRead"].diff().divide(host_dataframe["time_diff"])
-            host_dataframe["diskWrite"] = host_dataframe["diskWrite"].diff().divide(host_dataframe["time_diff"])
-            # first one has NaN has values
-            host_dataframe = host_dataframe.iloc[1:]
-            processed_host_stats = host_dataframe.to_dict('r')
-            processed_individual += processed_host_stats
-
-        self.host_stats = processed_individual
+        columns = ["time", "hostname", "cpu", "mem", "netOut", "netIn", "diskRead", "diskWrite"]
+        # CPU already comes pre processed
+        rate_columns = ["netOut", "netIn", "diskRead", "diskWrite"]
+
+        self.host_stats = self._process_rates(
+            self.host_stats, "hostname", list(self._get_nodes_hostname()), columns, rate_columns)
+
+    @staticmethod
+    def _process_rates(array, key, keys, columns, rate_columns):
+        """Converts the cumulative counters in `rate_columns` to rates.
+
+        Entries are grouped by `key` (e.g. container_id) and each group is
+        processed at once: rates are the difference to the previous entry of
+        the same group, divided by the time elapsed (saved as time_diff).
+        The first entry of each group has no rate and is dropped. Only groups
+        listed in `keys` are kept, output follows their order and then time.
+        """
+        if not array or not keys:
+            return []
+
+        dataframe = pandas.DataFrame(array)
+        dataframe = dataframe[dataframe[key].isin(keys)][columns]
+
+        # order groups as in keys, then by time (stable, keeps load order on ties)
+        order = dataframe[key].map({k: i for i, k in enumerate(keys)})
+        dataframe = dataframe.assign(key_order=order)
+        dataframe = dataframe.sort_values(by=["key_order", "time"], kind="mergesort")
+        dataframe = dataframe.drop(columns="key_order")
+
+        grouped = dataframe.groupby(key, sort=False)
+        # process bandwidth
+        dataframe["time_diff"] = grouped["time"].diff()
+        dataframe[rate_columns] = grouped[rate_columns].diff().divide(dataframe["time_diff"], axis=0)
+        # first one has NaN has values
+        dataframe = dataframe[grouped.cumcount() > 0]
+
+        return dataframe.to_dict('records')
 
     @staticmethod
     def _dump_json_to_file(file_path, array):
@@ -322,3 +513,27 @@ class Parser(object):
         with open(file_path, 'w') as file_object:
             # Save dict data into the JSON file.
             json.dump(array, file_object)
+
+    @staticmethod
+    def _dump_parquet_to_file(file_path, array):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("parquet output format requires pyarrow to be installed")
+
+        dataframe = pandas.DataFrame(array)
+        for column in dataframe.columns:
+            if column in DICTIONARY_COLUMNS:
+                dataframe[column] = dataframe[column].astype("category")
+            elif dataframe[column].dtype == object:
+                # some messages (e.g. marks without type) are dicts,
+                # parquet columns must have a single type, missing values stay null
+                dataframe[column] = [json.dumps(value) if isinstance(value, (dict, list)) else value
+                                     for value in dataframe[column]]
+
+        if "time" in dataframe.columns:
+            # stats tables are grouped by container/host, row groups spanning
+            # the whole run would never be skipped
+            dataframe = dataframe.sort_values(by="time", kind="mergesort")
+
+        dataframe.to_parquet(file_path, index=False, row_group_size=ROW_GROUP_SIZE)
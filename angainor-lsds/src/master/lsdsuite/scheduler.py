@@ -0,0 +1,212 @@
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the lateness histogram buckets
+LATENESS_BUCKETS = [0.001, 0.01, 0.1, 1, 10]
+
+
+class TimelineExecutor(object):
+    """Waits for the steps of a timeline on the monotonic clock.
+
+    Every step is due at an absolute deadline, `anchor + step time`, so time
+    spent logging, starting threads or oversleeping on one step doesn't
+    delay the following ones. `anchor` is the monotonic time of the start of
+    the round (now by default). How late each step was dispatched is kept
+    for the end of run report.
+    """
+
+    def __init__(self, anchor=None):
+        self.anchor = time.monotonic() if anchor is None else anchor
+        self.lateness = []  # [(step_number, step_time, lateness), ...]
+
+    @classmethod
+    def at_wall_clock(cls, start_date):
+        """Executor anchored at the (timezone aware) datetime `start_date`."""
+        import datetime
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return cls(time.monotonic() + (start_date - now).total_seconds())
+
+    def deadline(self, step_time):
+        return self.anchor + step_time
+
+    def remaining(self, step_time):
+        return self.deadline(step_time) - time.monotonic()
+
+    def wait(self, step_number, step_time):
+        """Sleeps until the step at `step_time` is due, returns how late it is."""
+        deadline = self.deadline(step_time)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(remaining)
+
+        lateness = time.monotonic() - deadline
+        self.lateness.append((step_number, step_time, lateness))
+        return lateness
+
+    def histogram(self):
+        """Returns the number of steps in each lateness bucket.
+
+        A list of (upper bound, count) pairs, the last bound is None.
+        """
+        bounds = LATENESS_BUCKETS + [None]
+        counts = [0] * len(bounds)
+        for _, _, lateness in self.lateness:
+            for i, bound in enumerate(bounds):
+                if bound is None or lateness < bound:
+                    counts[i] += 1
+                    break
+        return list(zip(bounds, counts))
+
+    def summary(self):
+        values = sorted(lateness for _, _, lateness in self.lateness)
+        if not values:
+            return {'steps': 0}
+
+        def percentile(p):
+            return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+        return {
+            'steps': len(values),
+            'mean': sum(values) / len(values),
+            'p50': percentile(50),
+            'p99': percentile(99),
+            'max': values[-1],
+            'histogram': [{'below': bound, 'steps': count} for bound, count in self.histogram()],
+            'lateness': [{'step': n, 'time': t, 'lateness': lateness}
+                         for n, t, lateness in self.lateness],
+        }
+
+    def log_report(self):
+        summary = self.summary()
+        if not summary['steps']:
+            return
+        log.info("Churn step lateness: mean %.1fms, p50 %.1fms, p99 %.1fms, max %.1fms",
+                 summary['mean'] * 1000, summary['p50'] * 1000,
+                 summary['p99'] * 1000, summary['max'] * 1000)
+        for bound, count in self.histogram():
+            if bound is None:
+                label = ">= " + _duration(LATENESS_BUCKETS[-1])
+            else:
+                label = "< " + _duration(bound)
+            log.info("   %8s: %d", label, count)
+
+
+def _duration(seconds):
+    if seconds < 1:
+        return "{:g}ms".format(seconds * 1000)
+    return "{:g}s".format(seconds)
+
+
+class StepExecutor(object):
+    """Runs churn steps on a fixed number of worker threads.
+
+    Steps with the same key (the service they change) run one at a time, in
+    the order they were submitted; steps of different services run
+    concurrently. At most `max_pending` steps can be queued or running,
+    `submit` blocks when the limit is reached. The outcome of every step is
+    kept in `results`.
+    """
+
+    def __init__(self, workers=16, max_pending=1000):
+        import threading
+        from collections import deque
+
+        self._lock = threading.Condition()
+        self._slots = threading.Semaphore(max_pending)
+        self._queues = {}  # {key: deque([(step_number, step, function, args), ...])}
+        self._ready = deque()  # keys with queued steps and none running
+        self._pending = 0
+        self._closed = False
+        self.results = []  # [StepResult, ...]
+
+        self._threads = [threading.Thread(target=self._work, name="churn-worker-{}".format(i),
+                                          daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, key, step_number, step, function, *args):
+        if not self._slots.acquire(blocking=False):
+            log.warning("Churn step %d: %d steps pending, waiting for a free slot",
+                        step_number, self._pending)
+            self._slots.acquire()
+
+        from collections import deque
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                # no step of this service is queued or running
+                queue = self._queues[key] = deque()
+                self._ready.append(key)
+            queue.append((step_number, step, function, args))
+            self._pending += 1
+            self._lock.notify_all()
+
+    def join(self):
+        """Waits until all submitted steps are done."""
+        with self._lock:
+            while self._pending:
+                self._lock.wait()
+
+    def shutdown(self):
+        self.join()
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        for t in self._threads:
+            t.join()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._ready and not self._closed:
+                    self._lock.wait()
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                step_number, step, function, args = self._queues[key][0]
+
+            start = time.monotonic()
+            error = None
+            try:
+                function(*args)
+            except Exception as e:
+                log.error("Churn step %d failed: %s", step_number, step, exc_info=1)
+                error = e
+            self.results.append(StepResult(step_number, step, time.monotonic() - start, error))
+
+            with self._lock:
+                queue = self._queues[key]
+                queue.popleft()
+                if queue:
+                    self._ready.append(key)
+                else:
+                    del self._queues[key]
+                self._pending -= 1
+                self._lock.notify_all()
+            self._slots.release()
+
+
+class StepResult(object):
+    def __init__(self, step_number, step, duration, error=None):
+        self.step_number = step_number
+        self.step = step
+        self.duration = duration
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_dict(self):
+        return {
+            'step': self.step_number,
+            'time': self.step.time,
+            'operation': self.step.operation,
+            'duration': self.duration,
+            'error': repr(self.error) if self.error is not None else None,
+        }
@@ -1,6 +1,8 @@
 package commands
 
 import (
+	"bufio"
+	"encoding/binary"
 	"encoding/json"
 	"fmt"
 	"io"
@@ -8,6 +10,12 @@ import (
 	"net"
 )
 
+// Maximum number of requests in flight on a single connection
+const maxPipelined = 64
+
+// Maximum size of a request frame
+const maxFrameSize = 64 << 20
+
 type Manager struct {
 	port uint
 	out  chan Command
@@ -50,13 +58,32 @@ func (m *Manager) Run() {
 func (m *Manager) handle(conn net.Conn) {
 	defer conn.Close()
 
+	reader := bufio.NewReader(conn)
+	first, err := reader.Peek(1)
+	if err != nil {
+		return
+	}
+
+	// A JSON document can't start with the first byte of a frame length
+	// (it would be a frame of more than 2GB), so the protocol is given by
+	// the first byte.
+	if first[0] == '{' {
+		m.handleLegacy(conn, reader)
+	} else {
+		m.handleFramed(conn, reader)
+	}
+}
+
+// Legacy protocol: a single JSON request, answered with a JSON response
+// terminated by a new line, and the connection is closed.
+func (m *Manager) handleLegacy(conn net.Conn, reader io.Reader) {
 	respond := func(resp Response) {
 		data, _ := json.Marshal(resp) // TODO: can an error even happen here?
 		conn.Write(data)
 		conn.Write([]byte{'\n'})
 	}
 
-	for decoder, cmd := json.NewDecoder(conn), (Command{}); ; {
+	for decoder, cmd := json.NewDecoder(reader), (Command{}); ; {
 		err := decoder.Decode(&cmd)
 		if err == io.EOF {
 			return
@@ -80,3 +107,81 @@ func (m *Manager) handle(conn net.Conn) {
 		return
 	}
 }
+
+// Framed protocol: requests and responses are JSON documents prefixed by
+// their length (4 bytes, big endian). The connection is kept open and
+// requests can be pipelined, responses are sent in the order of the requests.
+func (m *Manager) handleFramed(conn net.Conn, reader io.Reader) {
+	pending := make(chan chan Response, maxPipelined)
+	done := make(chan struct{})
+
+	go func() {
+		defer close(done)
+		var err error
+		for response := range pending {
+			// Always receive the response, so handlers never block
+			resp := <-response
+			if err == nil {
+				if err = writeFrame(conn, resp); err != nil {
+					log.Printf("ERROR: CMD: write: %v\n", err)
+					conn.Close()
+				}
+			}
+		}
+	}()
+
+	for {
+		data, err := readFrame(reader)
+		if err == io.EOF {
+			break
+		}
+
+		response := make(chan Response, 1)
+		pending <- response
+
+		if err != nil {
+			// Framing is broken, can't read further requests
+			log.Printf("ERROR: CMD: %v\n", err)
+			response <- Response{"err", err.Error()}
+			break
+		}
+
+		var cmd Command
+		if err := json.Unmarshal(data, &cmd); err != nil {
+			log.Printf("ERROR: CMD: JSON: %v\n", err)
+			response <- Response{"err", err.Error()}
+			continue
+		}
+
+		cmd.Response = response
+		m.out <- cmd
+	}
+
+	close(pending)
+	<-done
+}
+
+func readFrame(reader io.Reader) ([]byte, error) {
+	var size uint32
+	if err := binary.Read(reader, binary.BigEndian, &size); err != nil {
+		return nil, err
+	}
+	if size > maxFrameSize {
+		return nil, fmt.Errorf("frame too large: %d bytes", size)
+	}
+
+	data := make([]byte, size)
+	if _, err := io.ReadFull(reader, data); err != nil {
+		return nil, err
+	}
+	return data, nil
+}
+
+func writeFrame(writer io.Writer, resp Response) error {
+	data, _ := json.Marshal(resp)
+	frame := make([]byte, 4+len(data))
+	binary.BigEndian.PutUint32(frame, uint32(len(data)))
+	copy(frame[4:], data)
+	_, err := writer.Write(frame)
+	return err
+}
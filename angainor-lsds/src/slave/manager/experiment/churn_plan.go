@@ -0,0 +1,118 @@
+package experiment
+
+import (
+	"encoding/json"
+	"fmt"
+	"log"
+	"slave/manager/faults"
+)
+
+// compiledPlan is a churn timeline compiled by the master: amounts, action
+// ids and the slots of each container action are already resolved, so the
+// slave only has to build the executable events, without parsing the churn
+// nor simulating the replicas of every service
+type compiledPlan struct {
+	Injectors []planInjector `json:"injectors"`
+	Actions   []planAction   `json:"actions"`
+}
+
+// planInjector is what is done to a container, shared by the actions that
+// refer to it by index
+type planInjector struct {
+	Stop   bool                 `json:"stop"`
+	Signal string               `json:"signal"`
+	Fault  *faults.FaultDetails `json:"fault"`
+}
+
+// planAction is a single action of the plan
+// Kind is one of: "beginning", "end", "mark", "start" (N containers of Service
+// are started by the master) or "container" (Injector is applied to the
+// container in internal slot N of Service)
+type planAction struct {
+	Time     int    `json:"t"`
+	ID       int    `json:"i"`
+	Kind     string `json:"k"`
+	Service  string `json:"s"`
+	N        int    `json:"n"`
+	Injector int    `json:"j"`
+	Message  string `json:"m"`
+}
+
+func (value planInjector) build() (injectInContainerInterface, error) {
+	switch {
+	case value.Stop:
+		return stopContainerWorker{}, nil
+	case value.Signal != "":
+		return sendSignalWorker{Signal: value.Signal}, nil
+	case value.Fault != nil:
+		return injectFaultWorker{Details: *value.Fault}, nil
+	}
+	return nil, fmt.Errorf("Plan: injector must have stop, signal or fault")
+}
+
+// parsePlan decodes a compiled plan
+func parsePlan(stringPlan string) (compiledPlan, error) {
+	plan := compiledPlan{}
+	err := json.Unmarshal([]byte(stringPlan), &plan)
+	if err != nil {
+		err2 := fmt.Errorf("Error while unmarshal plan '%v'", err)
+		return plan, err2
+	}
+	return plan, nil
+}
+
+// importPlan creates the executable events of a compiled plan, which is
+// already sorted by time
+func importPlan(plan compiledPlan, translator TranslateServiceSlot) ([]executableEvent, error) {
+	injectors := make([]injectInContainerInterface, len(plan.Injectors))
+	for index, raw := range plan.Injectors {
+		injector, err := raw.build()
+		if err != nil {
+			return nil, fmt.Errorf("Injector %d: %v", index, err)
+		}
+		injectors[index] = injector
+	}
+
+	actions := make([]executableEvent, 0, len(plan.Actions))
+	previousTime := 0
+	for _, action := range plan.Actions {
+		if action.Time < previousTime {
+			return nil, fmt.Errorf("Plan: actions not sorted by time. Action: %+v", action)
+		}
+		previousTime = action.Time
+
+		eventStruct := executableEventStruct{
+			Time:                action.Time,
+			ProcessedInThisNode: false,
+			Id:                  action.ID,
+		}
+		switch action.Kind {
+		case "beginning":
+			eventStruct.ProcessedInThisNode = true
+			actions = append(actions, &BeginningMoment{executableEventStruct: eventStruct})
+		case "end":
+			actions = append(actions, &EndMoment{executableEventStruct: eventStruct})
+		case "mark":
+			actions = append(actions, &MarkMoment{executableEventStruct: eventStruct, CustomMessage: action.Message})
+		case "start":
+			actions = append(actions, &StartContainersMoment{
+				executableEventStruct: eventStruct,
+				serviceName:           action.Service,
+				numberContainers:      action.N,
+			})
+		case "container":
+			if action.Injector < 0 || action.Injector >= len(injectors) {
+				return nil, fmt.Errorf("Plan: unknown injector %d. Action: %+v", action.Injector, action)
+			}
+			slot, err := translator(action.N)
+			if err != nil {
+				return nil, fmt.Errorf("Plan: %v. Action: %+v", err, action)
+			}
+			actions = append(actions, NewExecutableContainerMoment(eventStruct, injectors[action.Injector], action.Service, slot))
+		default:
+			return nil, fmt.Errorf("Plan: '%s' not supported as action kind. Action: %+v", action.Kind, action)
+		}
+	}
+	log.Println("PARSE_PLAN:", len(actions), "actions imported")
+	return actions, nil
+}
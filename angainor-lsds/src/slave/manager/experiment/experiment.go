@@ -9,6 +9,7 @@ import (
 	"slave/manager/container_status"
 	"slave/manager/experiment/ActionsIdManager"
 	"strings"
+	"sync"
 	"time"
 
 	"github.com/docker/engine/client"
@@ -31,6 +32,9 @@ type Manager struct {
 	output            		chan<- string
 	marksOutput       		chan<- string
 	experimentLoaded		bool
+	// when the current run actually started, on this node's clock
+	runStartedAt			time.Time
+	runStartedMutex			sync.Mutex
 }
 
 // New Creates Manager
@@ -102,10 +106,35 @@ func (manager *Manager) PrepareExperiment(experimentChurn string) error {
 	return nil
 }
 
+// PreparePlan loads a churn timeline already compiled by the master
+// (see churn_plan.go), replacing PrepareExperiment's parse of the whole churn
+func (manager *Manager) PreparePlan(stringPlan string) error {
+	manager.experimentLoaded = false
+
+	plan, err := parsePlan(stringPlan)
+	if err != nil {
+		err2 := fmt.Errorf("Parsing Plan. Error '%v'", err)
+		return err2
+	}
+	slaveExecutableActions, err := importPlan(plan, manager.transtaleSlotFunction)
+	if err != nil {
+		err2 := fmt.Errorf("Importing plan. Error '%v'", err)
+		return err2
+	}
+
+	log.Println("PARSE_PLAN: Plan imported into experiment with success")
+	manager.experimentActions = slaveExecutableActions
+	manager.experimentLoaded = true
+
+	return nil
+}
+
 // PlayRun runs a previous loaded run
 func (manager *Manager) PlayRun(ctx context.Context, startAt time.Time) {
+	manager.setRunStartedAt(time.Time{})
 	difference := startAt.Sub(time.Now())
 	time.Sleep(difference)
+	manager.setRunStartedAt(time.Now())
 
 	log.Println("RUN: Starting Run")
 	moments := manager.experimentActions
@@ -130,6 +159,20 @@ func (manager *Manager) PlayRun(ctx context.Context, startAt time.Time) {
 }
 
 
+func (manager *Manager) setRunStartedAt(t time.Time) {
+	manager.runStartedMutex.Lock()
+	defer manager.runStartedMutex.Unlock()
+	manager.runStartedAt = t
+}
+
+// RunStartedAt returns when the last run played actually started, false if
+// it didn't start yet
+func (manager *Manager) RunStartedAt() (time.Time, bool) {
+	manager.runStartedMutex.Lock()
+	defer manager.runStartedMutex.Unlock()
+	return manager.runStartedAt, !manager.runStartedAt.IsZero()
+}
+
 // PlayRun runs a previous loaded run
 func (manager *Manager) DryRun() {
 	log.Println("DRY RUN: Starting Run")
@@ -4,7 +4,6 @@ import (
 	// "fmt"
 	"fmt"
 	"slave/manager/experiment/ActionsIdManager"
-	"slave/utils/bubble_sort"
 
 	"sort"
 
@@ -98,11 +97,9 @@ func (value *experimentMoment) importIntoExperiment(creator *experimentIterator,
 // into containerMoment. One moment contains one or multiple actions
 func importRawMoments(arrayRawMoments RawMoments, translator TranslateServiceSlot) ([]executableEvent, error) {
 	// sort array
-	//bubbleSort used in order to control the sort algorithm
-	//we will use bubble sort in master and slave
-	//no need to worry about performance because this only runs once per round,
-	//and with few items, generally already sorted
-	bubble_sort.BubbleSort(arrayRawMoments)
+	// stable sort by time, moments at the same time keep the order in which
+	// they were specified. The master orders its timeline the same way
+	sort.Stable(arrayRawMoments)
 
 
 	// not all events will translate to slave moments
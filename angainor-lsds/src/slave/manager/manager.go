@@ -293,43 +293,27 @@ func (m *Manager) handle(cmd commands.Command) {
 		cmd.Response <- resp("ok", "ntp sync container started")
 
 	case "ntp_offset":
-		// calculates the average offset, out of 5 tries
-		sum := 0.0
-		fails := 0
-		success := 0.0
-
-		for  ; success < 1.0 && fails < 5;  {
-			time.Sleep(100 * time.Millisecond)
-			var ntpTime *ntp.Response
-			var err error
-			ntpTime, err = ntp.Query("pool.ntp.org")
-			if err != nil {
-				time.Sleep(100 * time.Millisecond)
-				fmt.Println("ERROR1: ", err)
-				fails += 1
-			} else {
-				err := ntpTime.Validate()
-				if err != nil {
-					time.Sleep(100 * time.Millisecond)
-					fmt.Println("ERROR2: ", err)
-
-					fails += 1
-				} else {
-					success += 1.0
-					log.Println("NTP Offset: ", ntpTime.ClockOffset.Seconds(), " seconds")
-					sum = sum + ntpTime.ClockOffset.Seconds()
-				}
-			}
+		offset, err := ntpOffset()
+		if err != nil {
+			cmd.Response <- resp("err", err.Error())
+		} else {
+			cmd.Response <- resp("ok", offset)
 		}
-		if fails == 5 {
-			fmt.Println("There was an error")
-			cmd.Response <- resp("err", "Failed To retrieve NTP from server more than 5 times")
 
+	case "probe": // status, slave_version, faults_hash (of `params.path`) and ntp_offset at once
+		probe := map[string]string{"hostname": m.Hostname, "version": m.Version}
+		if hash, err := faults.CalculateMD5(cmd.MapStringParams["path"]); err != nil {
+			probe["faults_error"] = err.Error()
 		} else {
-
-			stringNumber := fmt.Sprintf("%.5f", (1000*sum)/success )
-			cmd.Response <- resp("ok", stringNumber)
+			probe["faults_hash"] = hash
+		}
+		if offset, err := ntpOffset(); err != nil {
+			probe["ntp_error"] = err.Error()
+		} else {
+			probe["ntp_offset"] = offset
 		}
+		v, _ := json.Marshal(probe)
+		cmd.Response <- resp("ok", string(v))
 
 	case "log": // Switch logging output to `params.file` ("default.log" if empty)
 		file := cmd.MapStringParams["file"]
@@ -341,8 +325,8 @@ func (m *Manager) handle(cmd commands.Command) {
 		cmd.Response <- resp("ok", "")
 		log.Printf("OUT: '%s'", file)
 
-	// Kill/pause/unpause containers `params.id` (comma-separated list of IDs) with signal `params.signal`
-	case "kill", "pause", "unpause":
+	// Kill/pause/unpause/stop containers `params.id` (comma-separated list of IDs) with signal `params.signal`
+	case "kill", "pause", "unpause", "stop":
 		id := cmd.MapStringParams["id"]
 		if id == "" {
 			cmd.Response <- resp("err", "params.id required")
@@ -522,6 +506,14 @@ func (m *Manager) handle(cmd commands.Command) {
 		cmd.Response <- resp("ok", "plan to start OK")
 
 
+	case "round_started": // when the round started by start_run_at actually started
+		startedAt, started := m.ExperimentManager.RunStartedAt()
+		if !started {
+			cmd.Response <- resp("err", "round not started")
+			break
+		}
+		cmd.Response <- resp("ok", startedAt.UTC().Format("2006-01-02T15:04:05.000000Z07:00"))
+
 	case "start_dry_run":
 		// TODO FIXME validate run exists
 		msg := "Start DRY Run"
@@ -550,6 +542,23 @@ func (m *Manager) handle(cmd commands.Command) {
 		log.Printf("PARSE_CHURN: OK\n")
 		cmd.Response <- resp("ok", "")
 
+	case "churn_plan":
+		// churn timeline compiled by the master, replaces churn_string
+		plan := cmd.MapStringParams["plan"]
+		if plan == "" {
+			cmd.Response <- resp("err", "params.plan required")
+			break
+		}
+
+		err := m.ExperimentManager.PreparePlan(plan)
+		if err != nil {
+			log.Printf("PARSE_PLAN: ERROR %+v\n", err)
+			cmd.Response <- resp("err", fmt.Sprint("While preparing experiment there was an error:", err))
+			break
+		}
+		log.Printf("PARSE_PLAN: OK\n")
+		cmd.Response <- resp("ok", "")
+
 	case "ipam":
 		name := "faultsee-ipam"
 		id := cmd.MapStringParams["id"]
@@ -630,6 +639,9 @@ func (m *Manager) containerKillPauseUnpause(action string, signal string, ids []
 	case "unpause":
 		f = containerUnpause
 
+	case "stop":
+		f = containerStop
+
 	default:
 		return nil, errors.New("Unsupported action: " + action)
 	}
@@ -671,6 +683,42 @@ func containerUnpause(client *client.Client, id string, signal string, res chan
 	res <- killResult{id, err}
 }
 
+// containerStop stops a container gracefully, like the stop steps of a plan
+func containerStop(client *client.Client, id string, signal string, res chan killResult) {
+	timeout := 10 * time.Second
+	err := client.ContainerStop(context.Background(), id, &timeout)
+	res <- killResult{id, err}
+}
+
+// ntpOffset returns the clock offset to pool.ntp.org in milliseconds, out
+// of up to 5 tries
+func ntpOffset() (string, error) {
+	sum := 0.0
+	fails := 0
+	success := 0.0
+
+	for success < 1.0 && fails < 5 {
+		time.Sleep(100 * time.Millisecond)
+		ntpTime, err := ntp.Query("pool.ntp.org")
+		if err == nil {
+			err = ntpTime.Validate()
+		}
+		if err != nil {
+			time.Sleep(100 * time.Millisecond)
+			fmt.Println("ERROR: ", err)
+			fails += 1
+		} else {
+			success += 1.0
+			log.Println("NTP Offset: ", ntpTime.ClockOffset.Seconds(), " seconds")
+			sum = sum + ntpTime.ClockOffset.Seconds()
+		}
+	}
+	if fails == 5 {
+		return "", errors.New("Failed To retrieve NTP from server more than 5 times")
+	}
+	return fmt.Sprintf("%.5f", (1000*sum)/success), nil
+}
+
 func resp(status string, message string) commands.Response {
 	return commands.Response{status, message}
 }